@@ -5,14 +5,25 @@ class Actuator(ABC):
     """Abstract class for actuators."""
 
     def __init__(self,obj):
-        self.sumo_obj = obj
-        self.sumoid = obj.getID()
+        self._sumo_obj = None if isinstance(obj,str) else obj   # given an id, the sumolib object is resolved on first use
+        self.sumoid = obj if isinstance(obj,str) else obj.getID()
         self.type = None
         self.baselinefreq = None
         self.params = {}
         self.state = {}
         
 
+    @property
+    def sumo_obj(self):
+        '''The sumolib object of the actuator'''
+        if self._sumo_obj is None:
+            self._sumo_obj = self.resolve_sumo_obj()
+        return self._sumo_obj
+
+    def resolve_sumo_obj(self):
+        '''Returns the sumolib object of an actuator created from its id'''
+        raise NotImplementedError(f"The sumolib object of {self.sumoid} cannot be resolved")
+
     @abstractmethod
     def init_params(self):
         pass
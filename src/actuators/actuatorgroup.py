@@ -1,17 +1,28 @@
 import json
-from numpy import array,multiply,zeros
+from numpy import array,zeros,full,nan,isnan,asarray,arange,unique
 from src.actuators.edge import Edge
 from src.actuators.inert import Inert
 from src.actuators.tls import TLS
 from src.actuators.vehicle import Vehicle
+from src.actuators.routing import RouteGuidance,RegionGuidance
 from tools.utils import all_equal
 
 class ActuatorGroup():
+    '''Group of the actuators of a network driven by the controller.
+
+        set_inputs only sends the inputs that differ by more than threshold from the value last
+        applied to each actuator, the others are suppressed. The applied values and the number of
+        commands sent and suppressed are kept until reset_actuation, called at the start of each run.
+    '''
     
-    def __init__(self,network,actuator_type,jsonfile = '',cycle = None,selection = False):
+    def __init__(self,network,actuator_type,jsonfile = '',cycle = None,selection = False,threshold = 0):
         self.network = network
         self.control_matrix = None
+        self.mapping = None
+        self.routing = None
+        self.n_regions = network.get_n_regions()
         self.cycle = cycle  
+        self.threshold = threshold   # minimum change of an input to send it to SUMO
 
         if selection: 
             with open(f'dep/sumo_files/{network.name}/selection/{actuator_type}/{actuator_type}All.json') as f:
@@ -30,14 +41,15 @@ class ActuatorGroup():
             self.usafety = 1
         if actuator_type == 'vehicle':
             self.init_vehicle(self.jsonfile)
-            self.lsafety = 0
-            self.usafety = 0
+            self.lsafety = 1    # free-flow travel times
+            self.usafety = 3
         if actuator_type == 'inert':
             self.init_inert(self.jsonfile)
         if actuator_type == 'edge':
             self.init_edges(self.jsonfile)
             self.lsafety = 0.5
             self.usafety = 1.5
+        self.reset_actuation()
 
     def init_params(self):
         for actuator in self.actuators:
@@ -47,8 +59,8 @@ class ActuatorGroup():
             disturbance.init_params()
             
     def init_tls(self,jsonfile):
-        redlights = self.network.get_tls()
-        self.actuators = [TLS(tls,self.control_cycle) for tls in redlights if tls.getID() in jsonfile['actuators']]
+        topology = self.network.topology   # the programs are read from the compiled .net.xml, not from SUMO
+        self.actuators = [TLS(tlsid,self.control_cycle,topology) for tlsid in topology.tls_ids.tolist() if tlsid in jsonfile['actuators']]
         self.encoding = {actuator.get_id():i for i,actuator in enumerate(self.actuators)}
     
     def init_edges(self,jsonfile):
@@ -60,54 +72,98 @@ class ActuatorGroup():
         self.encoding_disturbances = {actuator.get_id():i for i,actuator in enumerate(self.disturbances)}
 
     def init_vehicle(self,jsonfile):
-        pass
+        '''One input per region scaling the travel time of its edges in the route guidance, see RouteGuidance'''
+        self.routing = RouteGuidance(self.network,compliance = jsonfile.get('compliance',1),vclass = jsonfile.get('vclass','passenger'),
+                                     max_destinations = jsonfile.get('max_destinations',256),cache_size = jsonfile.get('cache_size',1024))
+        self.actuators = [RegionGuidance(region,self.routing) for region in range(self.n_regions)]
+        self.encoding = {actuator.get_id():i for i,actuator in enumerate(self.actuators)}
+        self.disturbances = []
+        self.encoding_disturbances = {}
 
     def init_inert(self):
         self.actuators = [Inert()]
         self.encoding = {actuator.get_id():i for i,actuator in enumerate(self.actuators)}
     
     def set_inputs(self,inputs,mapping = {}):
-        n_regions = self.network.get_n_regions()
+        '''Sets the inputs of the actuators, only those that changed by more than threshold are sent to SUMO.
+
+            Args:
+                inputs: one input per actuator, or with a mapping the (n_regions x n_regions) inputs of the
+                        pairs of regions (flattened or not) or one input per mapped pair (see set_mapping)
+                mapping: {i: {j: [actuator ids]}} the actuators driven by the input of the pair of regions (i, j)
+        '''
         if mapping == {}:
-            for i,actuator in enumerate(self.actuators):
-                actuator.set_input(inputs[i])
+            actuators = arange(len(self.actuators))
+            inputs = asarray(inputs,dtype=float)[:len(self.actuators)]
         else:
-            control_matrix = self.control_matrix(mapping)
-            u = u.reshape(n_regions,n_regions)
-            u_given={}
-            post_u = multiply(u,control_matrix)
-            
-            for i in range(self.n_regions):
-                for j in range(self.n_regions):
-                    if mapping[str(i)][str(j)] != []:
-                        for r in mapping[str(i)][str(j)]:
-                            u_given[r]= post_u[i,j]
-                            self.redlights[r].set_program(post_u[i,j])
+            if mapping != self.mapping:   # by content, controllers may build an equal mapping at each step
+                self.set_mapping(mapping)
+            actuators = self.mapped
+            inputs = asarray(inputs,dtype=float).ravel()
+            if len(inputs) == self.n_regions**2:
+                inputs = inputs[self.pairs]
+            elif len(inputs) != len(self.pairs):
+                raise ValueError(f"The mapped inputs must be {self.n_regions}x{self.n_regions} or one per mapped pair ({len(self.pairs)}), got {len(inputs)}")
+            inputs = inputs[self.actuator_pair]   # scattered to the actuators of each pair
+        applied = self.applied[actuators]
+        changed = isnan(applied) | (abs(inputs - applied) > self.threshold)
+        for i,u in zip(actuators[changed].tolist(),inputs[changed].tolist()):
+            self.actuators[i].set_input(u)
+        self.applied[actuators[changed]] = inputs[changed]
+        self.sent += int(changed.sum())
+        self.suppressed += int(len(changed) - changed.sum())
+        if self.routing is not None:   # the routes are sent once per step for all the regions
+            self.routing.update()
+
+    def set_mapping(self,mapping):
+        '''Precomputes the scatter of the inputs of the pairs of regions to the actuators.
+
+            Args:
+                mapping: {i: {j: [actuator ids]}} the actuators driven by the input of the pair of regions (i, j),
+                         an actuator mapped to several pairs is driven by the last one
+        '''
+        pair = {}
+        for i in mapping:
+            for j in mapping[i]:
+                for actuatorid in mapping[i][j]:
+                    if actuatorid not in self.encoding:
+                        raise ValueError(f"The actuator {actuatorid} mapped to the regions ({i},{j}) does not exist")
+                    pair[self.encoding[actuatorid]] = int(i)*self.n_regions + int(j)
+        self.mapping = {i: {j: list(mapping[i][j]) for j in mapping[i]} for i in mapping}   # a copy, the caller may modify its own
+        self.mapped = array(sorted(pair),dtype=int)                     # positions of the mapped actuators
+        flat = array([pair[i] for i in self.mapped.tolist()],dtype=int)  # flat pair index of each mapped actuator
+        self.pairs,self.actuator_pair = unique(flat,return_inverse=True) # the mapped pairs, position of the pair of each actuator
+        self.control_matrix = zeros((self.n_regions,self.n_regions))
+        self.control_matrix.flat[self.pairs] = 1
+
+    def reset_actuation(self):
+        '''Forgets the applied inputs and the actuation counts, the next inputs are all sent'''
+        self.applied = full(len(getattr(self,'actuators',[])),nan)
+        self.sent = 0
+        self.suppressed = 0
+
+    def get_actuation(self):
+        '''Returns the number of commands sent to SUMO and suppressed since the last reset'''
+        actuation = {'sent': self.sent,'suppressed': self.suppressed}
+        if self.routing is not None:
+            actuation['rerouted'] = self.routing.rerouted
+            actuation['reroute_failed'] = self.routing.failed
+        return actuation
 
     def set_inputs_disturbances(self,inputs):
         for i,actuator in enumerate(self.disturbances):
             actuator.set_input(inputs[i])
     
-    def control_matrix(self,mapping):
-        ''' builds the control matrix input used in MPC
+    def get_control_matrix(self,mapping):
+        ''' builds the control matrix input used in MPC, 1 for the pairs of regions with actuators
 
             Args:
                 mapping: a map between the input found by MPC
                         and the actuators
         '''
-        if self.control_matrix is not None:
-            return self.control_matrix
-        else:
-            self.mapping = mapping
-            control_martrix = zeros((self.n_regions,self.n_regions))
-            
-            for i in range(self.n_regions):
-                for j in range(self.n_regions):              
-                    if mapping[str(i)][str(j)] != []:
-                        control_martrix[i,j] = 1
-
-            self.control_matrix = control_martrix
-            return control_martrix
+        if mapping != self.mapping:
+            self.set_mapping(mapping)
+        return self.control_matrix
     
     def get_params(self):
         return {f"{actuator.get_id()}" : actuator.get_params() for actuator in self.actuators}
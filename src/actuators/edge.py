@@ -6,19 +6,32 @@ else:
     sys.exit("please declare environment variable 'SUMO_HOME'")
 
 import sumolib
-import traci
-from copy import deepcopy
+from src.simulations.backend import traci
 from src.actuators.actuator import Actuator
 from numpy import array
 
 class Edge(Actuator):
     
-    def __init__(self, obj,freq = 1):
+    def __init__(self, obj,freq = 1,topology = None):
+        '''
+        Args:
+            obj: the sumolib edge, or the edge id when built from a compiled topology
+            freq: the sampling period of the flow
+            topology: the Topology of the network, static attributes are read from it instead of sumolib
+        '''
         super().__init__(obj)
         self.type = 'edge'
         self.baselinefreq = freq
-        self.length = self.sumo_obj.getLength() #By the get_density function, assume this is in meters. TODO: verify
-        self.lane_number = self.sumo_obj.getLaneNumber()
+        self.topology = topology
+        self.index = topology.edges_encoding[self.sumoid] if topology is not None else None
+        if topology is not None:
+            self.length = float(topology.edge_length[self.index])
+            self.lane_number = int(topology.edge_lanes[self.index])
+            self.speed = float(topology.edge_speed[self.index])
+        else:
+            self.length = self.sumo_obj.getLength() #By the get_density function, assume this is in meters. TODO: verify
+            self.lane_number = self.sumo_obj.getLaneNumber()
+            self.speed = self.sumo_obj.getSpeed()
         self.cols = ['density','flow','CO2_emission','CO_emission','HC_emission',
                 'PMx_emission','NOx_emission','fuel_consumption','occupancy',
                 'mean_speed','mean_length','waiting_time',
@@ -38,13 +51,13 @@ class Edge(Actuator):
     def init_params(self):
 
         self.params = {
-            'length': self.sumo_obj.getLength(),
-            'from_node': self.sumo_obj.getFromNode().getID(),
-            'to_node': self.sumo_obj.getToNode().getID(),
-            'neighbours': self.recover_neighbours(),
-            'max_speed': self.sumo_obj.getSpeed(),
-            'usafety': self.sumo_obj.getSpeed()*1.5,
-            'lsafety': self.sumo_obj.getSpeed()*0.5,
+            'length': self.length,
+            'from_node': self.from_node_id,
+            'to_node': self.to_node_id,
+            'neighbours': self.neighbours,
+            'max_speed': self.speed,
+            'usafety': self.speed*1.5,
+            'lsafety': self.speed*0.5,
         }
     
     def init_region(self,label):
@@ -70,13 +83,23 @@ class Edge(Actuator):
     def set_disallowed(self,disallowedClasses=[]):
         traci.edge.setDisallowed(self.sumoid,disallowedClasses)
 
+    def resolve_sumo_obj(self):
+        return self.topology.get_net().getEdge(self.sumoid)
+
     def recover_neighbours(self):
         '''
         Finds and stores the IDs of all other edges that are connected to the start or end nodes of this edge.
         '''
+        if self.topology is not None:
+            self.from_node_id = str(self.topology.node_ids[self.topology.edge_from[self.index]])
+            self.to_node_id = str(self.topology.node_ids[self.topology.edge_to[self.index]])
+            self.neighbours = set(self.topology.get_edge_neighbours(self.index))
+            return
         neighbours =  set()  # Initialize an empty set to store the neighbour IDs
         self.from_node = self.sumo_obj.getFromNode()  # Get the node at the start of the edge
         self.to_node = self.sumo_obj.getToNode()  # Get the node at the end of the edge
+        self.from_node_id = self.from_node.getID()
+        self.to_node_id = self.to_node.getID()
         # Add the IDs of all incoming and outgoing edges for both nodes to the neighbours set
         neighbours.update([edge.getID() for edge in self.from_node.getIncoming()] + [edge.getID() for edge in self.from_node.getOutgoing()])
         neighbours.update([edge.getID() for edge in self.to_node.getIncoming()] + [edge.getID() for edge in self.to_node.getOutgoing()])
@@ -97,7 +120,7 @@ class Edge(Actuator):
         '''
         current_vehicles = set(traci.edge.getLastStepVehicleIDs(sumoid))  # Get the current set of vehicles on the edge
         entered = len(current_vehicles- self.last_step_vehicles)  # Calculate the number of vehicles that have entered since the last step
-        self.last_step_vehicles = deepcopy(current_vehicles)  # Update last_step_vehicles to the current set of vehicles
+        self.last_step_vehicles = current_vehicles  # Update last_step_vehicles to the current set of vehicles, a new set at every call
         return (entered*3600)/self.baselinefreq  # Calculate and return the flow, in vehicles per hour
 
     def get_region(self):
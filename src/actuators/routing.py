@@ -0,0 +1,189 @@
+import os,sys
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import zlib
+from collections import OrderedDict,Counter
+from traci import constants as tc
+from src.simulations.backend import traci
+from src.actuators.actuator import Actuator
+from numpy import ones,int16,int32
+from scipy.sparse.csgraph import dijkstra
+
+class RouteGuidance():
+    '''Region-aware route guidance of the vehicles in the network.
+
+        The free-flow travel time of the edges of region r is scaled by the input u_r of the region
+        (1 leaves it unchanged, above 1 the region is avoided). The shortest paths are computed on the
+        CSR graph of the connections of the Topology the guided vehicle class can drive through: a
+        batched Dijkstra on the reversed graph gives, for each destination, the next edge towards it
+        from every edge, kept as one compact array per destination. At most max_destinations of them
+        are computed per control step, the most requested first, the vehicles heading to the others
+        are guided at the next steps. The cache keeps the cache_size most recently used destinations,
+        it is cleared with the routes built from it when the inputs change.
+
+        At each control step the vehicles of the guided class departed since the last one are
+        subscribed to their route and route index, those arrived are dropped. The departed vehicles,
+        and all of them when the inputs changed, get the guided route when it differs from their
+        remaining route. The routes rejected by SUMO are counted in failed.
+
+        Attributes:
+            edges : the edge ids, ordered as Network.edges_encoding   list().
+            region : region of each edge                              np.array().
+            freeflow : free-flow travel time of each edge [s]         np.array().
+            inputs : the input of each region                         np.array().
+            compliance : fraction of the vehicles following the guidance  float.
+            vclass : the vehicle class guided                         str().
+            mask : the connections of the topology vclass can drive through  np.array().
+            max_destinations : destinations computed per control step  int.
+            cache_size : destinations kept in next_hop                int.
+            next_hop : destination - next edge towards it from each edge, for the current inputs  OrderedDict().
+            routes : (edge, destination) - guided route, for the current inputs  dict().
+            vehicles : the vehicles tracked                           set().
+            unguided : the vehicles not following the guidance        set().
+            pending : the vehicles not guided yet at the last update  set().
+            rerouted : number of setRoute sent since the last reset   int.
+            failed : number of setRoute rejected by SUMO since the last reset  int.
+    '''
+
+    def __init__(self,network,compliance = 1,vclass = 'passenger',max_destinations = 256,cache_size = 1024):
+        if max_destinations > cache_size:
+            raise ValueError(f"The destinations computed per step ({max_destinations}) must fit in the cache ({cache_size})")
+        self.topology = network.topology
+        self.edges = network.store.ids   # the edges of the network follow the order of the topology
+        self.region = network.store.region
+        self.freeflow = self.topology.edge_length/self.topology.edge_speed
+        self.compliance = compliance
+        self.vclass = vclass
+        self.mask = self.topology.get_successor_mask(vclass)
+        self.max_destinations = max_destinations
+        self.cache_size = cache_size
+        self.index_dtype = int16 if len(self.edges) < 2**15 else int32   # holds the -9999 of the unreachable edges
+        self.inputs = ones(network.get_n_regions())
+        self.reset()
+
+    def reset(self):
+        '''Forgets the vehicles and the routes, to be called at the start of each run'''
+        self.vehicles = set()
+        self.unguided = set()
+        self.pending = set()
+        self.changed = True
+        self.graph = None
+        self.next_hop = OrderedDict()
+        self.routes = {}
+        self.rerouted = 0
+        self.failed = 0
+
+    def set_input(self,region,u):
+        '''Sets the input of a region, the routes are recomputed at the next update'''
+        if u != self.inputs[region]:
+            self.inputs[region] = u
+            self.changed = True
+
+    def get_graph(self):
+        '''Returns the reversed graph of the connections of vclass, weighted by the travel time of the edge entered'''
+        return self.topology.get_successor_matrix(self.freeflow*self.inputs[self.region],self.mask).T.tocsr()
+
+    def is_guided(self,vehid):
+        '''Returns True if the vehicle follows the guidance, the same vehicles in every run'''
+        return zlib.crc32(vehid.encode()) % 1000 < self.compliance*1000 and traci.vehicle.getVehicleClass(vehid) == self.vclass
+
+    def compute_next_hops(self,destinations):
+        '''Computes with one Dijkstra on the reversed graph the next edge towards each destination from every edge'''
+        if self.graph is None:
+            self.graph = self.get_graph()
+        indices = [self.topology.edges_encoding[edge] for edge in destinations]
+        _,predecessors = dijkstra(self.graph,directed=True,indices=indices,return_predecessors=True)
+        for destination,row in zip(destinations,predecessors):
+            self.next_hop[destination] = row.astype(self.index_dtype)   # a copy, the batch is freed
+        while len(self.next_hop) > self.cache_size:
+            self.next_hop.popitem(last=False)   # least recently used
+
+    def get_route(self,edge,destination):
+        '''Returns the guided route (edge ids) from edge to destination, None if destination cannot be reached'''
+        key = (edge,destination)
+        if key not in self.routes:
+            next_hop = self.next_hop[destination]
+            route = [edge]
+            i = self.topology.edges_encoding[edge]
+            while i != self.topology.edges_encoding[destination]:
+                i = next_hop[i]
+                if i < 0:   # no path
+                    route = None
+                    break
+                route.append(self.edges[i])
+            self.routes[key] = route
+        self.next_hop.move_to_end(destination)
+        return self.routes[key]
+
+    def update(self):
+        '''Tracks the departures and arrivals and sends the guided routes, returns the number of vehicles rerouted'''
+        if self.changed:
+            self.graph = None
+            self.next_hop.clear()
+            self.routes = {}
+        active = set(traci.vehicle.getIDList())
+        new = active - self.vehicles - self.unguided
+        departed = [vehid for vehid in new if self.is_guided(vehid)]
+        self.unguided = (self.unguided & active) | (new - set(departed))   # checked once, getVehicleClass is a TraCI call
+        for vehid in departed:
+            traci.vehicle.subscribe(vehid,[tc.VAR_ROUTE_INDEX,tc.VAR_EDGES])
+        self.vehicles = (self.vehicles & active) | set(departed)   # the subscriptions of the arrived vehicles are closed by SUMO
+
+        results = traci.vehicle.getAllSubscriptionResults()
+        candidates = self.vehicles if self.changed else (self.pending & active) | set(departed)
+        self.pending = set()
+        remaining = {}
+        for vehid in candidates:
+            values = results.get(vehid)
+            if not values or values[tc.VAR_ROUTE_INDEX] < 0:   # subscribed or inserted at this step, guided at the next one
+                self.pending.add(vehid)
+                continue
+            route = values[tc.VAR_EDGES]
+            remaining[vehid] = list(route[values[tc.VAR_ROUTE_INDEX]:])
+        self.changed = False
+
+        missing = Counter(route[-1] for route in remaining.values() if route[-1] not in self.next_hop)
+        if missing:
+            self.compute_next_hops([destination for destination,_ in missing.most_common(self.max_destinations)])
+
+        rerouted = 0
+        failed = 0
+        for vehid,route in remaining.items():
+            if route[-1] not in self.next_hop:   # beyond max_destinations, guided at the next step
+                self.pending.add(vehid)
+                continue
+            guided = self.get_route(route[0],route[-1])
+            if guided is None or guided == route:
+                continue
+            try:
+                traci.vehicle.setRoute(vehid,guided)
+                rerouted += 1
+            except traci.TraCIException:   # e.g. the vehicle is on a junction and cannot change its current edge
+                failed += 1
+        self.rerouted += rerouted
+        self.failed += failed
+        return rerouted
+
+class RegionGuidance(Actuator):
+    '''Input of the route guidance for one region, see RouteGuidance'''
+
+    def __init__(self,region,routing):
+        super().__init__(f'region{region}')
+        self.type = 'vehicle'
+        self.region = region
+        self.routing = routing
+        self.uhat = 1
+
+    def init_params(self):
+        self.routing.reset()
+        self.params = {'region': self.region}
+
+    def set_input(self,u = float):
+        self.routing.set_input(self.region,u)
+
+    def get_uhat(self):
+        return self.uhat
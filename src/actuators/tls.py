@@ -6,7 +6,7 @@ else:
     sys.exit("please declare environment variable 'SUMO_HOME'")
 
 import sumolib
-import traci
+from src.simulations.backend import traci
 from src.actuators.actuator import Actuator
 from numpy import zeros, where, array
 
@@ -17,15 +17,49 @@ class TLS(Actuator):
     parameters:
         state: tuple containing the current states of the lights
         Logics: list of the loaded programs for the tls
+        logics: the program of each green duration, built once by init_program
+        loaded: the green durations whose program has been loaded in SUMO
+        green: the green duration of the active program, None for the original one
 
     '''
     
-    def __init__(self,obj,control_cycle = {}):
+    def __init__(self,obj,control_cycle = {},topology = None):
+        '''
+        Args:
+            obj: the sumolib traffic light, or its id when built from a compiled topology
+            control_cycle: the durations of the control cycle and of the yellow and red phases
+            topology: the Topology of the network, the static program and links are read from it instead of TraCI
+        '''
         super().__init__(obj)
         self.type = 'tls'
         self.control_cycle = control_cycle
+        self.topology = topology
+        if topology is not None:
+            # only the raw (duration, state) phases, the Phase/Logic types depend on the backend selected at start
+            i = topology.tls_encoding[self.sumoid]
+            self.originalstate = {'phases':topology.get_tls_phases(i),
+                                  'program':str(topology.tls_program[i]),
+                                  'controlledlinks':topology.get_tls_links(i),
+                                  }
+
+    def resolve_sumo_obj(self):
+        return self.topology.get_net().getTLS(self.sumoid)
 
     def init_params(self):
+        '''Identifies the phases of the program, read from SUMO unless it was read from the topology'''
+        if self.topology is None:
+            self.read_originalstate()
+        else:
+            self.build_originalstate()
+        self.baselinefreq = sum([phase.duration for phase in self.originalstate['logics'][0].phases])
+        self.init_program()
+
+    def build_originalstate(self):
+        '''Builds the static program read from the topology with the Phase/Logic of the selected backend'''
+        phases = [traci.trafficlight.Phase(duration, state) for duration,state in self.originalstate['phases']]
+        self.originalstate['logics'] = [traci.trafficlight.Logic(self.originalstate['program'], 0, 0, phases = phases)]
+
+    def read_originalstate(self):
 
         self.originalstate = {'state':traci.trafficlight.getRedYellowGreenState(self.sumoid),
                        'logics':traci.trafficlight.getAllProgramLogics(self.sumoid),
@@ -36,12 +70,10 @@ class TLS(Actuator):
                        'controlledlinks':traci.trafficlight.getControlledLinks(self.sumoid),
 
                       }
-        self.baselinefreq = sum([phase.duration for phase in self.originalstate['logics'][0].phases])
-        self.init_program()
 
     def update_state(self):
         self.state = {'state':traci.trafficlight.getRedYellowGreenState(self.sumoid),
-                'logics':traci.traci.trafficlight.getAllProgramLogics(self.sumoid),
+                'logics':traci.trafficlight.getAllProgramLogics(self.sumoid),
                 'program':traci.trafficlight.getProgram(self.sumoid),
                 'phase':traci.trafficlight.getPhase(self.sumoid),
                 'phase_duration':traci.trafficlight.getPhaseDuration(self.sumoid),
@@ -52,13 +84,35 @@ class TLS(Actuator):
     def set_input(self, u = float):  
         '''
         Sets the traffic light program based on a control parameter `u`. 
-        Calculates the duration of the green and red phases, 
-        verifies that the total cycle duration is unchanged, and sets the new phases and logic.
+        The green duration is rounded to the second, so the inputs giving the same green share one
+        program: it is loaded in SUMO with setProgramLogic the first time and switched to with
+        setProgram afterwards, nothing is sent if it is already active.
         '''
         # Calculate the duration of the green phase based on the control parameter `u`
-        green = float(round(u*(self.control_cycle['cycle_duration'] - self.n_phases[2]*self.control_cycle['yellow'] -self.control_cycle['red']*self.n_phases[1])/self.n_phases[0]))  
-        
-        # Calculate the duration of the red phase based on the control parameter `u`
+        green = self.get_green(u)
+        if green == self.green:
+            return
+        if green in self.loaded:
+            traci.trafficlight.setProgram(self.sumoid, self.logics[green].programID)
+        else:
+            if green not in self.logics:   # outside the precomputed grid, kept for the next identical input
+                self.logics[green] = self.build_logic(green)
+            self.logic = self.logics[green]
+            # Set the new logic for the traffic light in the SUMO simulation
+            traci.trafficlight.setProgramLogic(self.sumoid, self.logic)
+            self.loaded.add(green)
+        self.green = green
+
+    def get_green(self, u = float):
+        '''Returns the duration of the green phases for the control parameter `u`, rounded to the second'''
+        return float(round(u*(self.control_cycle['cycle_duration'] - self.n_phases[2]*self.control_cycle['yellow'] -self.control_cycle['red']*self.n_phases[1])/self.n_phases[0]))
+
+    def build_logic(self, green = float):
+        '''
+        Builds the program with the given green duration.
+        Calculates the duration of the red phases and verifies that the total cycle duration is unchanged.
+        '''
+        # Calculate the duration of the red phase based on the green duration
         red = float(round((self.control_cycle['cycle_duration'] - self.n_phases[2]*self.control_cycle['yellow'] -green*self.n_phases[0])/self.n_phases[1]))
         
         # Initialize a list to store the new phases
@@ -81,12 +135,19 @@ class TLS(Actuator):
             if self.identified_phases[j][0] == 'red':
                 phases.append(traci.trafficlight.Phase(red, self.identified_phases[j][1].state, 0, 0))
       
-        # Set the new logic with the new phases
-        self.logic = traci.trafficlight.Logic("0", 0, 0, phases = phases)
-        #self.logic = traci.trafficlight.Logic("0", 0, 0, phases)
-        
-        # Set the new logic for the traffic light in the SUMO simulation
-        traci.trafficlight.setProgramLogic(self.sumoid, self.logic)
+        # One program per green duration, so that it can be switched back to with setProgram
+        return traci.trafficlight.Logic(f"green{int(green)}", 0, 0, phases = phases)
+
+    def init_logics(self):
+        '''Builds the programs of all the green durations keeping the red phases non negative, none is loaded in SUMO yet'''
+        self.loaded = set()
+        self.green = None
+        self.logics = {}
+        for green in range(int(self.get_green(0)),int(self.get_green(1))+1):
+            try:
+                self.logics[float(green)] = self.build_logic(float(green))
+            except AssertionError:   # the rounding of the red phases changes the cycle duration
+                pass
     
     def init_program(self):
         '''
@@ -104,6 +165,7 @@ class TLS(Actuator):
             traci.trafficlight.setProgramLogic(self.get_id(), self.logic)
         
         self.identify_phases()
+        self.init_logics()
     
     ''' Generalize this so that it works also for all cases''' 
     def identify_phases(self):
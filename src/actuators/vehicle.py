@@ -6,7 +6,7 @@ else:
     sys.exit("please declare environment variable 'SUMO_HOME'")
 
 import sumolib
-import traci
+from src.simulations.backend import traci
 from src.actuators.actuator import Actuator
 
 class Vehicle(Actuator):
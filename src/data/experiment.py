@@ -19,6 +19,7 @@ class Experiment():
             - info: dictionary containing the paths to the files used in the simulation
             - results: dictionary containing the results of the simulation
             - output_path: output path were to save the results
+            - failed: True if the simulation was aborted early, e.g. on gridlock
     '''
 
     def __init__(self,info = None,description = ''):
@@ -28,6 +29,7 @@ class Experiment():
         self.id = self.info['taskparams']['id'] if info is not None else None
         self.results = info['results'] if info is not None else None
         self.output_path = info['output_path'] if info is not None else None
+        self.failed = info.get('failed',False) if info is not None else False
 
     def save(self):
         '''Saves an experiment to the out folder'''
@@ -36,7 +38,7 @@ class Experiment():
         [self.results[name].to_csv(self.output_path+'results/'+name+'.csv') for name in self.results]
         
         with open(self.output_path+'info.json','w') as f:
-            json.dump(self.info['taskparams'],f)
+            json.dump(dict(self.info['taskparams'],failed = self.failed),f)
 
         print(f"Saving experiment results to {self.output_path}. This directory can be copied and renamed if you want to retain the results, otherwise it will be overwritten during the next experiment!")
                 
@@ -44,6 +46,7 @@ class Experiment():
         '''Loads an experiment from the out folder'''
         self.info = json.load(open(path+"/info.json",'r'))
         self.id = self.info['id']
+        self.failed = self.info.get('failed',False)
         res = path+"/results/"
         files = os.listdir(res)
         self.results = {f"{file[:-4]}":pd.read_csv(res+file,index_col= 0) for file in files }
@@ -62,6 +65,8 @@ class Experiment():
         print("Description: \n")
         print(self.description)
         print("-"*30+"\n \n")
+        if self.failed:
+            print("The simulation was aborted early, the metrics only cover the simulated part \n")
         print("Summary Metrics: \n")
         print(self.results['metrics'])
 
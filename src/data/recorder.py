@@ -0,0 +1,92 @@
+import os,json
+from numpy import memmap,float32,asarray,searchsorted
+from pandas import DataFrame
+
+# edge variables recorded by default, see Edge.cols
+RECORDED = ['density','flow','mean_speed','waiting_time']
+
+class EdgeRecorder():
+    '''Records the state of every edge at each sample of a simulation into a memory-mapped file.
+
+        The (n_samples x n_edges x n_variables) float32 array is preallocated on disk in the output
+        directory of the run and filled one sample at a time, so long runs on large networks are
+        recorded without holding the series in RAM. The metadata (edges, variables, time of each
+        sample) are written next to it by close, the recording is then read with EdgeRecording.
+
+        Attributes:
+            path : path of the recording, without extension           str().
+            edges : the edge ids, ordered as Network.edges_encoding    list().
+            variables : the variables recorded                        list().
+            data : the memory-mapped array                            np.memmap.
+            times : the simulation time of each recorded sample [s]   list().
+    '''
+
+    def __init__(self,path,edges,variables = RECORDED,n_samples = 1):
+        self.path = path
+        self.edges = list(edges)
+        self.variables = list(variables)
+        os.makedirs(os.path.dirname(path) or '.',exist_ok=True)
+        self.data = memmap(path+'.dat',dtype=float32,mode='w+',shape=(n_samples,len(self.edges),len(self.variables)))
+        self.times = []
+
+    def record(self,time,state):
+        '''Writes the (n_edges x n_variables) state sampled at time'''
+        k = len(self.times)
+        if k >= len(self.data):
+            raise ValueError(f"The recording {self.path} is full, it was allocated for {len(self.data)} samples")
+        self.data[k] = state
+        self.times.append(float(time))
+
+    def close(self):
+        '''Flushes the samples to disk and writes the metadata'''
+        self.data.flush()
+        with open(self.path+'.json','w') as f:
+            json.dump({'shape': list(self.data.shape),
+                       'dtype': 'float32',
+                       'edges': self.edges,
+                       'variables': self.variables,
+                       'times': self.times},f)
+        del self.data
+
+class EdgeRecording():
+    '''Read-only view of a recording written by EdgeRecorder, sliced without loading it in RAM.
+
+        Attributes:
+            edges : the edge ids                                      list().
+            variables : the variables recorded                        list().
+            times : the simulation time of each sample [s]            np.array().
+            data : (n_samples x n_edges x n_variables) recorded samples  np.memmap.
+    '''
+
+    def __init__(self,path):
+        path = path[:-len('.json')] if path.endswith('.json') else path
+        with open(path+'.json') as f:
+            meta = json.load(f)
+        self.edges = meta['edges']
+        self.variables = meta['variables']
+        self.times = asarray(meta['times'])
+        self.index = {edgeid: i for i,edgeid in enumerate(self.edges)}
+        self.data = memmap(path+'.dat',dtype=meta['dtype'],mode='r',shape=tuple(meta['shape']))[:len(self.times)]
+
+    def get(self,variable,edges = None,begin = None,end = None):
+        '''Returns the (n_samples x n_edges) values of variable sampled in [begin, end)
+
+            Args:
+                variable: one of the recorded variables
+                edges: the ids of the edges to return, all of them if None
+                begin, end: simulation time bounds [s], the whole recording if None
+        '''
+        if variable not in self.variables:
+            raise ValueError(f"The variable {variable} was not recorded, recorded variables: {self.variables}")
+        first = 0 if begin is None else searchsorted(self.times,begin)
+        last = len(self.times) if end is None else searchsorted(self.times,end)
+        values = self.data[first:last,:,self.variables.index(variable)]
+        if edges is not None:
+            values = values[:,[self.index[edgeid] for edgeid in edges]]
+        return asarray(values)
+
+    def to_dataframe(self,variable,edges = None,begin = None,end = None):
+        '''Returns the values of variable as a DataFrame indexed by time, one column per edge'''
+        first = 0 if begin is None else searchsorted(self.times,begin)
+        last = len(self.times) if end is None else searchsorted(self.times,end)
+        return DataFrame(self.get(variable,edges,begin,end),index=self.times[first:last],columns=self.edges if edges is None else list(edges))
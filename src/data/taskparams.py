@@ -27,6 +27,18 @@ class TaskParams():
     n_threads : int = 1
     degree : int = 4
     n_PWA : int = 10
+    backend : str = 'traci'
+    collector : str = 'threaded'
+    warmup : int | None = None
+    outputs : list | None = None
+    compress_outputs : bool = False
+    mesosim : bool = False
+    gridlock_patience : int | None = None
+    exact_flow : bool = False
+    transfers : bool = False
+    online_theta : bool = False
+    record_edges : list | bool | None = None
+    actuation_threshold : float = 0
 
     "Estimate params"
     labels : str | None = None
@@ -38,6 +50,7 @@ class TaskParams():
     clusteringalg: str | None = None
     supersampling: bool | None = None
     superfreq: int | None = None
+    supersampling_reduction: str = 'mean'
 
     "Control and study params" 
     parameters: list | None = None
@@ -30,13 +30,8 @@ class LinearModel():
         # self.Theta = network.Theta
 
         # gamma converts density to accumulation
-        # accumulation = density * gamma
-        self.gamma = np.zeros(self.n_regions)
-        for i in range(self.n_regions):
-            num_edges = self.network.regions.regions[i].get_num_edges()
-            lanes_per_edge = self.network.get_const_lane_number()
-            edge_length = self.network.get_const_edge_length_km()
-            self.gamma[i] = num_edges * lanes_per_edge * edge_length
+        # accumulation = density * gamma, gamma being the lane-km of each region
+        self.gamma = np.array(self.network.regions.get_lane_km(), dtype=float)
     
         # Construct empty linear system
         # User needs to explicitly call linearize around (Ts, rho_star, v_star)!
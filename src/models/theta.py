@@ -1,6 +1,7 @@
-from lxml import etree
-from numpy import zeros,save
+from tools.utils import iter_xml
+from numpy import zeros,save,array,full,setdiff1d
 from copy import deepcopy
+from src.simulations.backend import traci
 
 class Theta():
 
@@ -14,18 +15,16 @@ class Theta():
     def build_theta(self,xmlfile,network):
         """- routing : fraction of the people theta_ij^h that want to go from i to j passing through h"""
 
-        parser = etree.XMLParser(recover=True)
-        tree = etree.parse(xmlfile,parser= parser)
-        root = tree.getroot()
         routes = {}
-        total_veh = len(root)
+        total_veh = 0
         n_regions = network.get_n_regions()
         Theta = zeros((n_regions,n_regions,n_regions))
         
         counter = 0
-        for veh in root:
+        for veh in iter_xml(xmlfile,'vehicle'):
             
-            id = veh.values()[0]
+            total_veh += 1
+            id = veh.get('id')
             try:
                 routes[id]= veh.__getitem__(0).values()[0].split(' ')
             except:
@@ -83,7 +82,71 @@ class Theta():
                     Theta[i[id],j[id],h]+=(1/div)
                   
         Theta = Theta/total_veh
-        self.T = Theta        
-        
+        self.T = Theta
+
+
+class OnlineTheta():
+    '''Routing tensor Theta estimated during the simulation from the routes of the live vehicles.
+
+        update is called after each simulation step: the route of every vehicle seen for the first
+        time is mapped to its regions through the edge-region lookup array, and its contribution to
+        theta_ij^h (same rules as Theta.build_theta) is added. The contributions of the vehicles that
+        left the network are removed from the tensor of the active vehicles, giving a time-varying Theta.
+        A vehicle departing and arriving between two updates is not seen, and the route is the one
+        at its first sight (later reroutings are ignored).
+
+        Attributes:
+            encoding : mapping edge id - position (Network.edges_encoding)   dict().
+            edge_region : region of each edge, ordered as encoding            np.array().
+            counts : (n x n x n) contributions of all the vehicles seen so far  np.array().
+            active_counts : (n x n x n) contributions of the vehicles in the network  np.array().
+            active : contribution (flat indices, weights) of each vehicle in the network  dict().
+            n_vehicles : number of vehicles seen so far                       int.
+    '''
+
+    def __init__(self,network):
+        self.n_regions = network.get_n_regions()
+        self.encoding = network.get_edges_encoding()
+        self.edge_region = network.store.region
+        self.counts = zeros((self.n_regions,self.n_regions,self.n_regions))
+        self.active_counts = zeros((self.n_regions,self.n_regions,self.n_regions))
+        self.active = {}
+        self.n_vehicles = 0
+
+    def get_contribution(self,route):
+        '''Returns the flat indices of theta_ij^h a route contributes to and the weight of each'''
+        regions = self.edge_region[[self.encoding[edge] for edge in route]]
+        i,j = regions[0],regions[-1]
+        passing = setdiff1d(regions[1:-1],[i,j])
+        if len(passing) == 0:
+            passing = array([j])
+        return (i*self.n_regions + j)*self.n_regions + passing, full(len(passing),1/len(passing))
+
+    def update(self):
+        '''Adds the vehicles departed and removes the vehicles arrived since the last update'''
+        vehicles = set(traci.vehicle.getIDList())
+        for vehid in vehicles - self.active.keys():
+            indices,weights = self.get_contribution(traci.vehicle.getRoute(vehid))
+            self.counts.flat[indices] += weights
+            self.active_counts.flat[indices] += weights
+            self.active[vehid] = (indices,weights)
+            self.n_vehicles += 1
+        for vehid in self.active.keys() - vehicles:
+            indices,weights = self.active.pop(vehid)
+            self.active_counts.flat[indices] -= weights
+
+    def get_theta(self,active = False):
+        '''Returns Theta over all the vehicles seen so far, or over the vehicles in the network if active'''
+        if active:
+            return self.active_counts/max(len(self.active),1)
+        return self.counts/max(self.n_vehicles,1)
+
+    def get_snapshot(self):
+        '''Returns the state of the estimator, to resume it with set_snapshot'''
+        return {'counts': self.counts,'active_counts': self.active_counts,'active': self.active,'n_vehicles': self.n_vehicles}
 
-        
\ No newline at end of file
+    def set_snapshot(self,snapshot):
+        self.counts = snapshot['counts']
+        self.active_counts = snapshot['active_counts']
+        self.active = snapshot['active']
+        self.n_vehicles = snapshot['n_vehicles']
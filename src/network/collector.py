@@ -0,0 +1,296 @@
+import os,sys
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import socket,time
+from queue import Queue,Empty
+from multiprocessing.pool import ThreadPool
+from threading import Thread
+from xml.etree.ElementTree import XMLPullParser
+from traci import constants as tc
+from src.simulations.backend import traci
+from numpy import array,zeros,arange,array_split
+
+# TraCI variable retrieved for each of the Edge.cols
+VARIABLES = {'density': tc.LAST_STEP_VEHICLE_NUMBER,
+             'flow': tc.LAST_STEP_VEHICLE_ID_LIST,
+             'CO2_emission': tc.VAR_CO2EMISSION,
+             'CO_emission': tc.VAR_COEMISSION,
+             'HC_emission': tc.VAR_HCEMISSION,
+             'PMx_emission': tc.VAR_PMXEMISSION,
+             'NOx_emission': tc.VAR_NOXEMISSION,
+             'fuel_consumption': tc.VAR_FUELCONSUMPTION,
+             'occupancy': tc.LAST_STEP_OCCUPANCY,
+             'mean_speed': tc.LAST_STEP_MEAN_SPEED,
+             'mean_length': tc.LAST_STEP_LENGTH,
+             'waiting_time': tc.VAR_WAITING_TIME,
+             'noise_emission': tc.VAR_NOISEEMISSION,
+             'electricity_consumption': tc.VAR_ELECTRICITYCONSUMPTION}
+
+# edgeData attribute aggregated by SUMO for each of the Edge.cols supported by MeanDataCollector
+MEANDATA = {'density': 'laneDensity',
+            'flow': 'entered',
+            'occupancy': 'occupancy',
+            'mean_speed': 'speed'}
+
+class Collector():
+    '''Base class of the objects retrieving the state of the edges during a simulation.
+
+        A collector lives as long as the simulation and owns whatever it needs to retrieve the state
+        (workers, subscriptions, sockets). The measurements are written to the edge store and averaged
+        over the regions. The wall time of every retrieval is recorded.
+
+        Attributes:
+            regions : the Regions object whose state is collected     Regions.
+            store : the edge store the measurements are written to    EdgeStore.
+            cols : the variables collected, subset of Edge.cols        list().
+            index : mapping edge id - position in the store (Network.edges_encoding)  dict().
+            flow_counter : counts the flow exactly with induction loops, None to let the collector measure it  FlowCounter.
+            polled : the variables retrieved by the collector itself, cols without those counted  list().
+            timings : wall time of each retrieval [s]                 list().
+    '''
+
+    name = ''
+    supported = list(VARIABLES)
+
+    def __init__(self,regions,cols = [],flow_counter = None):
+        self.regions = regions
+        self.store = regions.store
+        self.n_edges = self.store.n_edges
+        self.cols = list(cols)
+        for col in self.cols:
+            if col not in self.supported:
+                raise ValueError(f"The variable {col} cannot be collected by the {self.name} collector, please select among {self.supported}")
+        self.index = self.store.index
+        self.flow_counter = flow_counter
+        self.polled = [col for col in self.cols if not (col == 'flow' and flow_counter is not None)]
+        self.timings = []
+
+    def get_edge_state(self,cols = []):
+        '''Returns the (n_edges x len(cols)) state of the edges at the current step, rows ordered as Network.edges_encoding.
+
+            The values are written to the rows of the edge store, which are overwritten by the next call.
+        '''
+        missing = [col for col in cols if col not in self.cols]
+        if missing:
+            raise ValueError(f"The variables {missing} are not collected, collected variables: {self.cols}")
+        start = time.perf_counter()
+        self.collect([col for col in cols if col in self.polled])
+        if self.flow_counter is not None and 'flow' in cols:
+            self.flow_counter.collect()
+        self.timings.append(time.perf_counter() - start)
+        return self.store.get_state(cols)
+
+    def get_state(self,cols = []):
+        '''Returns the (n_regions x len(cols)) state of the regions, averaged over their edges'''
+        return self.store.aggregate(self.get_edge_state(cols),cols)
+
+    def collect(self,cols = []):
+        '''Writes the current values of cols to the edge store'''
+        raise NotImplementedError("collect method must be implemented in subclasses")
+
+    def get_timing(self):
+        '''Returns the number of retrievals and their total, mean and max wall time [s]'''
+        timings = array(self.timings) if self.timings else zeros(1)
+        return {'collector': self.name,
+                'steps': len(self.timings),
+                'total': float(timings.sum()),
+                'mean': float(timings.mean()),
+                'max': float(timings.max())}
+
+    def close(self):
+        '''Releases the resources of the collector'''
+        pass
+
+class PollingCollector(Collector):
+    '''Collects the state of the regions polling every edge through Edge.get_state.
+
+        With n_threads > 1 the edges are split in n_threads contiguous chunks polled by a pool of
+        workers created once with the collector, otherwise they are polled serially.
+
+        Attributes:
+            splits : the positions of the edges polled by each worker   list().
+            pool : the workers, None when serial                        ThreadPool.
+    '''
+
+    def __init__(self,regions,cols = [],n_threads = 1,flow_counter = None):
+        super().__init__(regions,cols,flow_counter)
+        self.name = 'threaded' if n_threads > 1 else 'serial'
+        self.edges = regions.edges
+        self.splits = array_split(arange(self.n_edges),max(1,n_threads))
+        self.pool = ThreadPool(n_threads) if n_threads > 1 else None
+
+    def poll(self,split,cols = []):
+        return [self.edges[i].get_state(cols) for i in split]
+
+    def collect(self,cols = []):
+        if self.pool is None:
+            values = self.poll(self.splits[0],cols)
+        else:
+            values = [state for states in self.pool.map(lambda split: self.poll(split,cols),self.splits) for state in states]
+        self.store.set_state(cols,array(values).reshape(self.n_edges,len(cols)))
+
+    def close(self):
+        '''Stops the workers'''
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+class SubscriptionCollector(Collector):
+    '''Collects the state of the regions from TraCI edge subscriptions.
+
+        Every edge is subscribed once to the variables needed by cols, afterwards a single
+        getAllSubscriptionResults call per step retrieves the whole network. Density and flow
+        are computed as in Edge.get_density and Edge.get_flow.
+
+        Attributes:
+            varids : the TraCI variables subscribed                   list().
+            last_vehicles : vehicles on each edge at the previous step  list().
+    '''
+
+    name = 'subscription'
+
+    def __init__(self,regions,cols = [],flow_counter = None):
+        super().__init__(regions,cols,flow_counter)
+        self.varids = list(dict.fromkeys(VARIABLES[col] for col in self.polled))
+        self.last_vehicles = [set() for _ in range(self.n_edges)]
+
+    def subscribe(self):
+        '''Subscribes every edge to the collected variables, to be called once after traci.start'''
+        for edgeid in self.index:
+            traci.edge.subscribe(edgeid,self.varids)
+
+    def get_results(self):
+        '''Returns the subscription results of the current step as a dict edge id - {variable: value}'''
+        return traci.edge.getAllSubscriptionResults()
+
+    def collect(self,cols = []):
+        state = self.store.state
+        rows = self.store.get_rows(cols)
+        scalars = [(row,VARIABLES[col]) for row,col in zip(rows,cols) if col != 'flow']
+        flow = rows[cols.index('flow')] if 'flow' in cols else None
+        index = self.index
+        last_vehicles = self.last_vehicles
+
+        for edgeid,values in self.get_results().items():
+            i = index.get(edgeid)
+            if i is None:   # internal edges are not part of the network
+                continue
+            for row,varid in scalars:
+                state[row,i] = values[varid]
+            if flow is not None:
+                current = set(values[tc.LAST_STEP_VEHICLE_ID_LIST])
+                state[flow,i] = len(current - last_vehicles[i])
+                last_vehicles[i] = current
+
+        if 'density' in cols:
+            state[rows[cols.index('density')]] *= 1000/self.store.lane_length   # vehicles per km
+        if flow is not None:
+            state[flow] *= 3600/self.store.baselinefreq                         # vehicles per hour
+
+class ContextCollector(SubscriptionCollector):
+    '''Collects the state of the regions from a single context subscription covering all edges.
+
+        A context subscription on the simulation domain returns every object of the target domain,
+        so the whole network is subscribed with one call instead of one call per edge.
+    '''
+
+    name = 'context'
+
+    def subscribe(self):
+        '''Subscribes all the edges with one context subscription, to be called once after traci.start'''
+        traci.simulation.subscribeContext("",tc.CMD_GET_EDGE_VARIABLE,0,self.varids)
+
+    def get_results(self):
+        return traci.simulation.getContextSubscriptionResults("")
+
+class MeanDataCollector(Collector):
+    '''Collects the state of the regions averaged by SUMO over each sampling period.
+
+        SUMO aggregates the edges itself through an edgeData output with period equal to the
+        sampling period, so no edge is polled from Python and the values are averages over the
+        whole period instead of a snapshot at its end. The output is streamed to a local socket
+        (SUMO writes outputs named host:port to a socket) and parsed as each interval is written.
+
+        Attributes:
+            period : the aggregation period of SUMO [s]             int.
+            begin : the begin of the first interval [s]             int.
+            port : the local port the edgeData output is sent to    int.
+            intervals : (end, state) of the intervals received and not yet consumed   Queue.
+            timeout : maximum wait for an interval after the step that completes it [s]  float.
+    '''
+
+    name = 'meandata'
+    supported = list(MEANDATA)
+
+    def __init__(self,regions,cols = [],period = 1,begin = 0,timeout = 60):
+        super().__init__(regions,cols)
+        self.period = period
+        self.begin = begin
+        self.timeout = timeout
+        self.intervals = Queue()
+        self.last_end = begin
+        self.state = zeros((self.n_edges,len(self.cols)))
+        self.store.set_state(self.cols,self.state)
+        self.server = socket.create_server(('localhost',0))
+        self.port = self.server.getsockname()[1]
+        Thread(target=self.listen,daemon=True).start()
+
+    def write_additional(self,path):
+        '''Writes the edgeData additional streaming to the collector, to be loaded by SUMO at start. Returns its path.'''
+        with open(path,'w') as f:
+            f.write(f'''<additional>
+    <edgeData id="collector" period="{self.period}" begin="{self.begin}" file="localhost:{self.port}" excludeEmpty="false"/>
+</additional>''')
+        return path
+
+    def listen(self):
+        '''Receives the edgeData output of SUMO and queues each interval once complete'''
+        try:
+            connection,_ = self.server.accept()
+        except OSError:   # closed before SUMO connected
+            return
+        parser = XMLPullParser(events=('end',))
+        attributes = [MEANDATA[col] for col in self.cols]
+        flow = self.cols.index('flow') if 'flow' in self.cols else None
+        with connection:
+            while True:
+                chunk = connection.recv(1 << 16)
+                if not chunk:
+                    break
+                parser.feed(chunk)
+                for _,element in parser.read_events():
+                    if element.tag != 'interval':
+                        continue
+                    state = zeros((self.n_edges,len(self.cols)))
+                    for edge in element.iter('edge'):
+                        i = self.index.get(edge.get('id'))
+                        if i is not None:
+                            state[i] = [float(edge.get(attribute,0)) for attribute in attributes]
+                    if flow is not None:
+                        state[:,flow] *= 3600/self.period   # vehicles per hour
+                    self.intervals.put((float(element.get('end')),state))
+                    element.clear()
+
+    def collect(self,cols = []):
+        '''Writes the averages over the last completed period to the edge store.
+
+            Waits for SUMO to send the interval ending at the current time, before the first
+            interval is complete the state is zero.
+        '''
+        now = traci.simulation.getTime()
+        while self.last_end + self.period <= now:
+            try:
+                self.last_end,self.state = self.intervals.get(timeout=self.timeout)
+            except Empty:
+                raise ValueError(f"SUMO did not send the edgeData interval ending at {self.last_end + self.period} within {self.timeout}s "
+                                 f"(time {now}), check that the additional of the collector was loaded and that localhost:{self.port} is reachable")
+            self.store.set_state(self.cols,self.state)
+
+    def close(self):
+        '''Stops accepting connections, the running one is drained until SUMO closes the output'''
+        self.server.close()
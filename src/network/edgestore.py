@@ -0,0 +1,101 @@
+from numpy import array,asarray,zeros,arange,bincount,maximum
+from scipy.sparse import csr_matrix
+
+# variables defined per lane-km, their regional value is the lane-km weighted mean of the edges
+LANE_KM_WEIGHTED = ['density','occupancy']
+
+class EdgeStore():
+    '''Struct-of-arrays view of the edges of the network.
+
+        The static attributes of the edges and the last measured value of each variable are kept
+        as contiguous NumPy vectors ordered by Network.edges_encoding. The regional aggregation is
+        a product with precomputed sparse (n_regions x n_edges) operators built from the real
+        length and number of lanes of each edge, so irregular networks are aggregated exactly in O(nnz).
+
+        Attributes:
+            cols : the variables stored, as Edge.cols                   list().
+            ids : the edge ids                                          list().
+            index : mapping edge id - position in the vectors           dict().
+            length : length of each edge [m]                            np.array().
+            lane_number : number of lanes of each edge                  np.array().
+            lane_length : length times number of lanes [m]              np.array().
+            lane_km : length times number of lanes [km]                 np.array().
+            baselinefreq : sampling period used for the flow [s]        np.array().
+            region : region id of each edge, None without regions       np.array().
+            region_size : number of edges of each region                np.array().
+            region_lane_km : lane-km of each region, converts density to accumulation  np.array().
+            mean_operator : CSR averaging the edges of each region       csr_matrix.
+            density_operator : CSR averaging the edges of each region weighted by lane-km  csr_matrix.
+            accumulation_operator : CSR summing density times lane-km over each region  csr_matrix.
+            state : (len(cols) x n_edges) last measured values, one contiguous row per variable  np.array().
+    '''
+
+    def __init__(self,edges,labels = None):
+        self.cols = list(edges[0].cols) if len(edges) else []
+        self.ids = [edge.get_id() for edge in edges]
+        self.index = {edgeid: i for i,edgeid in enumerate(self.ids)}
+        self.n_edges = len(self.ids)
+        self.length = array([edge.length for edge in edges],dtype=float)
+        self.lane_number = array([edge.lane_number for edge in edges],dtype=int)
+        self.lane_length = self.length*self.lane_number
+        self.lane_km = self.lane_length/1000
+        self.baselinefreq = array([edge.baselinefreq for edge in edges],dtype=float)
+        self.state = zeros((len(self.cols),self.n_edges))
+        self.set_regions(labels)
+
+    def set_regions(self,labels = None):
+        '''Sets the region id of each edge and builds the aggregation operators, labels are ordered as the edges'''
+        if labels is None:
+            self.region = None
+            self.n_regions = 0
+            self.region_size = None
+            self.region_lane_km = None
+            self.mean_operator = self.density_operator = self.accumulation_operator = None
+            return
+
+        self.region = asarray(labels,dtype=int)
+        self.n_regions = int(self.region.max()) + 1
+        self.region_size = bincount(self.region,minlength=self.n_regions)
+        self.region_lane_km = bincount(self.region,weights=self.lane_km,minlength=self.n_regions)
+        shape = (self.n_regions,self.n_edges)
+        columns = arange(self.n_edges)
+        self.mean_operator = csr_matrix((1/maximum(self.region_size,1)[self.region],(self.region,columns)),shape=shape)
+        self.density_operator = csr_matrix((self.lane_km/maximum(self.region_lane_km,1e-12)[self.region],(self.region,columns)),shape=shape)
+        self.accumulation_operator = csr_matrix((self.lane_km,(self.region,columns)),shape=shape)
+
+    def get_rows(self,cols = []):
+        '''Returns the rows of the state holding cols'''
+        return [self.cols.index(col) for col in cols]
+
+    def set_state(self,cols,values):
+        '''Stores the (n_edges x len(cols)) values measured for cols'''
+        self.state[self.get_rows(cols)] = asarray(values).T
+
+    def get_state(self,cols = []):
+        '''Returns the (n_edges x len(cols)) last values of cols'''
+        return self.state[self.get_rows(cols)].T
+
+    def aggregate(self,values,cols = None):
+        '''Averages edgewise values over the regions.
+
+            Args:
+                values: (n_edges,) or (n_edges x k) values ordered as the edges
+                cols: the variables of the k columns, those in LANE_KM_WEIGHTED are weighted by lane-km,
+                      None averages every column without weights
+            Returns:
+                (n_regions,) or (n_regions x k) regional means
+        '''
+        values = asarray(values,dtype=float)
+        regional = self.mean_operator @ values
+        for j,col in enumerate(cols or []):
+            if col in LANE_KM_WEIGHTED:
+                regional[:,j] = self.density_operator @ values[:,j]
+        return regional
+
+    def get_accumulation(self,density):
+        '''Returns the number of vehicles in each region from the (n_edges,) edge densities [veh/km/lane]'''
+        return self.accumulation_operator @ asarray(density,dtype=float)
+
+    def get_regional_state(self,cols = []):
+        '''Returns the (n_regions x len(cols)) regional values of the last measurements of cols'''
+        return self.aggregate(self.get_state(cols),cols)
@@ -0,0 +1,129 @@
+import os,sys
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+from traci import constants as tc
+from src.simulations.backend import traci
+from numpy import array,repeat,bincount
+
+class LoopCounter():
+    '''Base class of the counters built on generated induction loops.
+
+        SUMO counts every vehicle crossing a loop at each simulation step and aggregates the counts
+        over the sampling period, so nothing crosses unseen between two samples. The counts of the
+        last completed period are read through subscriptions and summed over the loops of each target.
+
+        Attributes:
+            period : the sampling period, aggregation period of the loops [s]  int.
+            loops : the ids of the loops                              list().
+            attributes : the attributes of each loop (lane, pos, ...)  list().
+            target : the target (edge, pair of regions, ...) each loop is counted for  np.array().
+            n_targets : number of targets                              int.
+    '''
+
+    prefix = 'loop'
+
+    def __init__(self,period = 1):
+        self.period = period
+        self.loops = []
+        self.attributes = []
+        self.target = array([],dtype=int)
+        self.n_targets = 0
+
+    def write_additional(self,path):
+        '''Writes the induction loops, to be loaded by SUMO at start. Returns its path.'''
+        with open(path,'w') as f:
+            f.write('<additional>\n')
+            for loop,attributes in zip(self.loops,self.attributes):
+                attributes = ' '.join(f'{key}="{value}"' for key,value in attributes.items())
+                f.write(f'    <inductionLoop id="{loop}" {attributes} period="{self.period}" file="NUL"/>\n')
+            f.write('</additional>')
+        return path
+
+    def subscribe(self):
+        '''Subscribes every loop to the vehicles counted in its last interval, to be called once after traci.start'''
+        for loop in self.loops:
+            traci.inductionloop.subscribe(loop,[tc.VAR_LAST_INTERVAL_NUMBER])
+
+    def get_counts(self):
+        '''Returns the (n_targets,) number of vehicles counted for each target during the last completed period'''
+        results = traci.inductionloop.getAllSubscriptionResults()
+        counts = array([results[loop][tc.VAR_LAST_INTERVAL_NUMBER] if loop in results else 0 for loop in self.loops],dtype=float)
+        return bincount(self.target,weights=counts,minlength=self.n_targets)
+
+class FlowCounter(LoopCounter):
+    '''Counts exactly the vehicles entering each edge over each sampling period.
+
+        A loop is generated at the entry (position 0) of every lane, so the vehicles that traverse an
+        edge between two samples are counted too, which the comparison of the vehicles on the edge at
+        two samples (Edge.get_flow) misses. Vehicles inserted on an edge do not cross its entry and
+        are not counted.
+
+        Attributes:
+            store : the edge store the flows are written to           EdgeStore.
+    '''
+
+    prefix = 'flow'
+
+    def __init__(self,store,period = 1):
+        super().__init__(period)
+        self.store = store
+        lanes = [f'{edgeid}_{lane}' for edgeid,n_lanes in zip(store.ids,store.lane_number.tolist()) for lane in range(n_lanes)]
+        self.loops = [f'{self.prefix}_{lane}' for lane in lanes]
+        self.attributes = [{'lane': lane,'pos': 0} for lane in lanes]
+        self.target = repeat(range(store.n_edges),store.lane_number)
+        self.n_targets = store.n_edges
+
+    def get_flow(self):
+        '''Returns the (n_edges,) flow of each edge over the last completed period [veh/h]'''
+        return self.get_counts()*3600/self.period
+
+    def collect(self):
+        '''Writes the flow of the last completed period to the edge store'''
+        self.store.set_state(['flow'],self.get_flow()[:,None])
+
+    def get_state(self):
+        '''Returns the (n_regions,) flow of the regions over the last completed period [veh/h]'''
+        return self.store.aggregate(self.get_flow())
+
+class TransferCounter(LoopCounter):
+    '''Counts the vehicles crossing from one region to another over each sampling period.
+
+        A crossing is a move from an edge of region i to a following edge of region j != i. A loop
+        is generated at the end of every lane of the edges of region i that lead into region j,
+        restricted with nextEdges to the vehicles continuing on the edge of region j. Only the
+        edges on the region boundaries get loops.
+
+        Attributes:
+            n_regions : number of regions                             int.
+            pairs : the (from edge, to edge) crossings with a loop    list().
+    '''
+
+    prefix = 'transfer'
+
+    def __init__(self,store,topology,period = 1):
+        super().__init__(period)
+        self.n_regions = store.n_regions
+        region = store.region
+        self.pairs = []
+        target = []
+        for u,edgeid in enumerate(store.ids):
+            node = topology.edge_to[topology.edges_encoding[edgeid]]
+            for nextid in topology.get_node_outgoing(node):
+                v = store.index.get(nextid)
+                if v is None or region[v] == region[u]:
+                    continue
+                self.pairs.append((edgeid,nextid))
+                for lane in range(store.lane_number[u]):
+                    self.loops.append(f'{self.prefix}_{edgeid}_{lane}_{nextid}')
+                    self.attributes.append({'lane': f'{edgeid}_{lane}','pos': -1,'friendlyPos': 'true','nextEdges': nextid})
+                    target.append(region[u]*self.n_regions + region[v])
+        self.target = array(target,dtype=int)
+        self.n_targets = self.n_regions**2
+
+    def get_transfers(self):
+        '''Returns the (n_regions x n_regions) vehicles that crossed from region i (row) to region j (column) during the last completed period'''
+        return self.get_counts().reshape(self.n_regions,self.n_regions)
@@ -12,17 +12,18 @@ if 'SUMO_HOME' in os.environ:
 else:   
     sys.exit("please declare environment variable 'SUMO_HOME'")
     
-import sumolib
-import traci
+from src.simulations.backend import traci
 
-from numpy import array,array_split,load
-from multiprocessing.pool import ThreadPool
+from numpy import array,load
 from networkx import Graph
 
 from network.node import Node
+from network.topology import Topology
 from actuators.edge import Edge
 from network.regions import Regions
+from network.edgestore import EdgeStore
 from network.region import Region
+from network.collector import PollingCollector,SubscriptionCollector,ContextCollector,MeanDataCollector
 
 class Network():
     '''Model a city in the form of a graph, i.e. a tuple composed by a set of edges and a set of nodes.                          
@@ -32,15 +33,17 @@ class Network():
 
         Attributes:
             net_path : path of the .net.xml file    str().
+            topology : compiled topology, cached next to the .net.xml   Topology.
             control_cycle : contains the control cycle for control   dict().
             sumo_obj : the underlying Sumolib object    sumolib object.
             n_edges : number of edges in the network    int().
             n_nodes : number of nodes in the network    int().
             n_tls : number of traffic lights            int().
-            nodes : dictionary of pairs id-sumolib obj  dict().
+            nodes : the Node objects, built on first access   np.array().
             nodes_encoding : mapping between id-int     dict().
             edges : dictionary of pairs id-sumolib obj  dict().
             edges_encoding : mapping between id-int     dict().
+            store : struct-of-arrays view of the edges (lengths, lanes, regions, state)  EdgeStore.
             redlights : dictionary of pairs id-sumolib obj  dict().
             redlights_encoding : mapping between id-int     dict().
             control_redlights : mapping id-sumolib obj of the actuators dict().
@@ -68,52 +71,136 @@ class Network():
             self.demand = load(demand_path)
         if theta_path is not None:
             self.Theta = load(theta_path, allow_pickle=True)
-        try:
-            self.sumo_obj = sumolib.net.readNet(f"./dep/sumo_files/{self.name}/network/{self.name}.net.xml")
-        except:
+        self.net_path = f"./dep/sumo_files/{self.name}/network/{self.name}.net.xml"
+        if not os.path.exists(self.net_path):
             raise ValueError("The network file doesn't exist")
+        self.topology = Topology.load(self.net_path)
+        self._tls = None
                     
         self.init_nodes()
         self.init_edges() 
-        self.tls = self.sumo_obj.getTrafficLights()
         self.n_regions = self.labels.max() + 1 if labels is not None else 0 
-        self.regions = Regions(self.labels,self.edges,self.edges_encoding, n_PWA) if labels is not None else None   
+        self.regions = Regions(self.labels,self.edges,self.edges_encoding, n_PWA, self.store) if labels is not None else None   
         self.perimeter = self.init_perimeter() if self.regions is not None else None 
         self.graph = Graph(self.regions.adjacency) if self.regions is not None else None
         self.n_edges = len(self.edges)
-        self.n_nodes = len(self.nodes)
-        self.n_tls = len(self.tls)
+        self.n_nodes = len(self.nodes_encoding)
+        self.n_tls = len(self.topology.tls_ids)
+
+    @property
+    def sumo_obj(self):
+        '''The sumolib network, read from the .net.xml on first use'''
+        return self.topology.get_net()
+
+    @property
+    def tls(self):
+        '''The sumolib traffic lights, read on first use'''
+        if self._tls is None:
+            self._tls = self.sumo_obj.getTrafficLights()
+        return self._tls
           
     def init_nodes(self):
-        '''Initializes the nodes of the network'''
+        '''Initializes the nodes of the network, only their encoding is built here and the
+            Node objects are created on the first access to nodes'''
         
-        nodes = self.sumo_obj.getNodes()
-        self.nodes = array([Node(node) for node in nodes])
-        self.nodes_encoding = {node.get_id(): i for i,node in enumerate(self.nodes)}
+        self._nodes = None
+        self.nodes_encoding = self.topology.nodes_encoding
+
+    @property
+    def nodes(self):
+        '''The Node objects of the network, built on first use'''
+        if self._nodes is None:
+            self._nodes = array([Node(node,self.topology) for node in self.topology.node_ids.tolist()])
+        return self._nodes
+
+    def get_node(self,nodeid):
+        '''Returns the Node with the given id'''
+        return self.nodes[self.nodes_encoding[nodeid]]
 
     
     def init_edges(self):
         '''Initializes the edges of the network.'''
-        edges = self.sumo_obj.getEdges()
-        self.edges = array([Edge(edge,self.freq) for edge in edges])
+        self.edges = array([Edge(edge,self.freq,self.topology) for edge in self.topology.edge_ids.tolist()])
         self.edges_encoding = {edge.get_id(): i for i,edge in enumerate(self.edges)}
+        self.store = EdgeStore(self.edges,self.labels)
+        # Length and lanes of the first edge, only meaningful on regular grids: the regional
+        # aggregation uses the lane-km of every edge (EdgeStore, Regions.get_lane_km)
         self.edge_length_km = self.edges[0].get_length_km() 
-        # TODO: Generalize this later, for now we just use the first edge
         self.lanes_per_edge = self.edges[0].get_lane_number()
 
     
     def get_state(self, byregion = False,cols = []):
-        '''Returns the state of the network'''
+        '''Returns the state of the network.
+
+            With a collector and byregion = False the edge state is returned
+            as a (n_edges x len(cols)) array ordered by edges_encoding.
+        '''
         if byregion:
             return self.regions.get_state(cols)
+        elif self.regions is not None and self.regions.collector is not None:
+            return self.regions.collector.get_edge_state(cols)
         else:
-            splits = array_split(self.edges, self.n_threads)
-            with ThreadPool(self.n_threads) as pool:
-                results  = pool.map(lambda x: x.get_state(cols),self.edges)
-            state = results
-
-            return state
+            return [edge.get_state(cols) for edge in self.edges]
     
+    def init_collector(self,mode = 'threaded',cols = [],period = 1,begin = 0,flow_counter = None):
+        '''Initializes the collector used by get_state, to be called once after traci.start
+            ('meandata' before traci.start, its additional must be loaded by SUMO)
+
+            Args:
+                mode: 'serial' polls every edge through Edge.get_state,
+                      'threaded' does the same with n_threads workers kept for the whole simulation
+                      'subscription' subscribes every edge to cols and reads them in one call per step
+                      'context' subscribes all the edges at once with a context subscription on the simulation
+                      'meandata' lets SUMO average cols over each period through an edgeData output
+                cols: the variables that will be retrieved
+                period: the sampling period, used by 'meandata'
+                begin: the begin of the simulation, used by 'meandata'
+                flow_counter: a FlowCounter whose loops are loaded by SUMO, the flow is then counted exactly
+                              instead of being measured by the collector (not used by 'meandata')
+        '''
+        self.close_collector()
+        if mode == 'serial':
+            self.regions.collector = PollingCollector(self.regions,cols,1,flow_counter)
+        elif mode == 'threaded':
+            self.regions.collector = PollingCollector(self.regions,cols,self.n_threads,flow_counter)
+        elif mode == 'subscription':
+            self.regions.collector = SubscriptionCollector(self.regions,cols,flow_counter)
+            self.regions.collector.subscribe()
+        elif mode == 'context':
+            self.regions.collector = ContextCollector(self.regions,cols,flow_counter)
+            self.regions.collector.subscribe()
+        elif mode == 'meandata':   # SUMO already counts the vehicles entering each edge over the period
+            self.regions.collector = MeanDataCollector(self.regions,cols,period,begin)
+        else:
+            raise ValueError(f"The collector {mode} does not exist, please select 'serial', 'threaded', 'subscription', 'context' or 'meandata'")
+        if flow_counter is not None and mode != 'meandata':
+            flow_counter.subscribe()
+
+    def get_collector_timing(self):
+        '''Returns the timing of the state retrievals of the current collector, None without collector'''
+        if self.regions is None or self.regions.collector is None:
+            return None
+        return self.regions.collector.get_timing()
+
+    def close_collector(self):
+        '''Closes and drops the collector, the subscriptions are closed together with the TraCI connection'''
+        if self.regions is not None and self.regions.collector is not None:
+            self.regions.collector.close()
+            self.regions.collector = None
+
+    def get_last_vehicles(self):
+        '''Returns the vehicles seen on each edge at the last flow measurement, used to resume a run from a snapshot'''
+        if self.regions is not None and hasattr(self.regions.collector,'last_vehicles'):
+            return list(self.regions.collector.last_vehicles)
+        return [edge.last_step_vehicles for edge in self.edges]
+
+    def set_last_vehicles(self,last_vehicles = []):
+        '''Restores the vehicles seen on each edge at the last flow measurement'''
+        if self.regions is not None and self.regions.collector is not None:
+            self.regions.collector.last_vehicles = list(last_vehicles)
+        for edge,vehicles in zip(self.edges,last_vehicles):
+            edge.last_step_vehicles = set(vehicles)
+
     def init_perimeter(self):
         'Returns the nodes on the perimeter between regions'
         self.perimeter = self.regions.get_perimeter()
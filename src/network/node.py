@@ -4,6 +4,9 @@ class Node():
     This class represents a node (intersection) in a traffic network.
     It uses methods from the SUMO traffic simulation package.
     
+    It can be built from the sumolib node or from the compiled Topology of the network,
+    in which case the sumolib node is only resolved when sumo_obj is accessed.
+    
     Attributes:
         sumo_obj: The SUMO object representing the node
         id: The ID of the node
@@ -11,22 +14,41 @@ class Node():
         outgoing: The IDs of all outgoing edges
         type: The type of node: priority, traffic light, etc.
         coordinates: The coordinates of the node
-        node_neighbours: The neighboring nodes
+        node_neighbours: The IDs of the neighboring nodes
         edge_neighbours: The neighboring edges
     '''
     
-    def __init__(self,sumo_obj) -> None:
+    def __init__(self,sumo_obj,topology = None) -> None:
         '''
-        Constructor for the Node class. Initializes attributes using the provided SUMO object.
+        Constructor for the Node class. Initializes attributes using the provided SUMO object,
+        or the node id and the topology of the network.
         '''
-        self.sumo_obj= sumo_obj  # The SUMO object representing the node
-        self.id = sumo_obj.getID()  # The ID of the node
-        self.incoming = [edge.getID() for edge in sumo_obj.getIncoming()]  # The IDs of all incoming edges
-        self.outgoing = [edge.getID() for edge in sumo_obj.getOutgoing()]  # The IDs of all outgoing edges
-        self.type = sumo_obj.getType()  # The type of the node
-        self.coordinates = sumo_obj.getCoord()  # The coordinates of the node
-        self.node_neighbours = sumo_obj.getNeighboringNodes(outgoingNodes=True, incomingNodes=True)  # The neighboring nodes
+        self.topology = topology
+        if topology is not None:
+            self._sumo_obj = None
+            self.id = sumo_obj  # The ID of the node
+            i = topology.nodes_encoding[self.id]
+            self.incoming = topology.get_node_incoming(i)  # The IDs of all incoming edges
+            self.outgoing = topology.get_node_outgoing(i)  # The IDs of all outgoing edges
+            self.type = str(topology.node_type[i])  # The type of the node
+            self.coordinates = tuple(topology.node_coords[i])  # The coordinates of the node
+            self.node_neighbours = topology.get_node_neighbours(i)  # The IDs of the neighboring nodes
+        else:
+            self._sumo_obj = sumo_obj  # The SUMO object representing the node
+            self.id = sumo_obj.getID()  # The ID of the node
+            self.incoming = [edge.getID() for edge in sumo_obj.getIncoming()]  # The IDs of all incoming edges
+            self.outgoing = [edge.getID() for edge in sumo_obj.getOutgoing()]  # The IDs of all outgoing edges
+            self.type = sumo_obj.getType()  # The type of the node
+            self.coordinates = sumo_obj.getCoord()  # The coordinates of the node
+            self.node_neighbours = [node.getID() for node in sumo_obj.getNeighboringNodes(outgoingNodes=True, incomingNodes=True)]  # The IDs of the neighboring nodes
         self.edge_neighbours = self.incoming+ self.outgoing  # The neighboring edges
+
+    @property
+    def sumo_obj(self):
+        '''The SUMO object representing the node, resolved on first use when built from the topology'''
+        if self._sumo_obj is None:
+            self._sumo_obj = self.topology.get_net().getNode(self.id)
+        return self._sumo_obj
     
     def is_perimeter(self,i = int):
         '''
@@ -1,6 +1,7 @@
 from numpy import array,zeros,mean,polynomial
 from scipy.optimize import minimize_scalar
 from copy import deepcopy
+from src.network.edgestore import LANE_KM_WEIGHTED
 
 class Region():
 
@@ -8,14 +9,20 @@ class Region():
         self.id = id
         self.edges = edges
         self.edge_ids = [edge.get_id() for edge in edges]
+        self.lane_km = array([edge.length*edge.lane_number for edge in edges])/1000
         self.init_perimeter()
         self.mfd = None
         self.pwa = None
     
 
     def get_state(self,cols = []):
-        '''Returns the state of the region'''
-        return array([edge.get_state(cols) for edge in self.edges]).mean(axis = 0)
+        '''Returns the state of the region, the variables per lane-km (density, occupancy) are weighted by the lane-km of the edges'''
+        states = array([edge.get_state(cols) for edge in self.edges]).reshape(len(self.edges),len(cols))
+        state = states.mean(axis = 0)
+        for j,col in enumerate(cols):
+            if col in LANE_KM_WEIGHTED:
+                state[j] = states[:,j] @ self.lane_km/self.lane_km.sum()
+        return state
 
     def init_perimeter(self):
         
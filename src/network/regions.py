@@ -1,21 +1,25 @@
 from collections import Counter
-from multiprocessing.pool import ThreadPool
 from src.network.region import Region
+from src.network.edgestore import EdgeStore
 
-from numpy import array,hstack,zeros,tile,load,eye
+from numpy import array,hstack,zeros,ones,tile,load,arange,linspace,sqrt,mean
+from scipy.sparse import csr_matrix
+from pandas import DataFrame
 
 class Regions():
 
-    def __init__(self,labels,edges,edges_encoding, n_PWA) -> None:
+    def __init__(self,labels,edges,edges_encoding, n_PWA, store = None) -> None:
         self.labels = labels 
         self.edges = edges
         self.n_edges = len(edges)
         self.edges_encoding = edges_encoding
+        self.store = store if store is not None else EdgeStore(edges,labels)
         self.regions = []
         self.n_regions = labels.max() + 1
         self.init_regions(self.n_regions,labels)
         self.onehotencoding()
         self.n_PWA = n_PWA
+        self.collector = None
         
     
     def init_regions(self,n_regions = int,labels = array):
@@ -40,33 +44,32 @@ class Regions():
         
     
     def onehotencoding(self):
-        '''One hot encoding of the labels'''
-        self.onehot = eye(self.n_edges,self.n_regions)
-        for i in range(self.n_edges):
-            for j in  range(self.n_regions):
-                if self.edges[i].get_region() == j:
-                    self.onehot[i,j] = 1
-
-    def group_by_region(self,matrix):
+        '''One hot encoding of the labels, as a sparse (n_edges x n_regions) matrix'''
+        self.onehot = csr_matrix((ones(self.n_edges),(arange(self.n_edges),self.store.region)),shape=(self.n_edges,self.n_regions))
+
+    def group_by_region(self,matrix,cols = None):
         '''Groups edgewise matrix data into regionwise
 
             Args:
-                matrix: The data matrix to be grouped
+                matrix: The data matrix to be grouped, edges are columns
+                cols: the variable of each row, see EdgeStore.aggregate
             Returns:
-                regional_matrix: The grouped data, regions are rows
+                regional_matrix: The grouped data averaged over the edges of each region
         '''
-        n_edges = array([len(region.edges) for region in self.regions])
-        regional_matrix = (matrix@self.onehot)/n_edges
-        
-        return regional_matrix
+        return self.store.aggregate(array(matrix).T,cols).T
+
+    def get_lane_km(self):
+        '''Returns the lane-km of each region, i.e. the factor converting its density into accumulation'''
+        return self.store.region_lane_km
 
     def get_state(self,cols = []):
         '''Returns the state of the regions'''
+        if self.collector is not None:
+            return self.collector.get_state(cols)
         
-        with ThreadPool(self.n_regions) as pool:
-            results = array(pool.map(lambda x: x.get_state(cols),self.regions))
+        self.store.set_state(cols,array([edge.get_state(cols) for edge in self.edges]).reshape(self.n_edges,len(cols)))
 
-        return results
+        return self.store.get_regional_state(cols)
     
     def approximate_MFD(self,mfddata,degree,n_PWA = 10):
         '''Approximates the MFD of the regions'''
@@ -78,6 +81,46 @@ class Regions():
             self.regions[i].recover_critical()
             self.regions[i].approximate_PWA(n_PWA)
         
+    def compare_MFD(self,reference,candidate,degree = 4,n_PWA = 10,tolerance = 0.1):
+        '''Compares the MFDs fitted on two datasets of the regions, e.g. a micro (reference) and a meso (candidate) run.
+
+            Args:
+                reference: (n_regions x 2 x T) density-flow data the candidate is compared to
+                candidate: (n_regions x 2 x T) density-flow data to assess
+                degree: the degree of the polynomial used in the approximation
+                n_PWA: number of piecewise affine functions of the approximation
+                tolerance: maximum relative error for the candidate to be trusted
+
+            Returns:
+                A DataFrame with one row per region: critical density, maximum flow and their relative errors,
+                RMSE between the two fitted MFDs over the observed densities and whether the candidate is trusted.
+                The regions keep the MFDs fitted on the reference data.
+        '''
+        fitted = {}
+        for name,data in [('candidate',candidate),('reference',reference)]:
+            self.approximate_MFD(data,degree,n_PWA)
+            fitted[name] = [(region.mfd,region.n_crit,region.get_flowstar()) for region in self.regions]
+
+        rows = []
+        for i in range(self.n_regions):
+            mfd_ref,n_crit_ref,flow_ref = fitted['reference'][i]
+            mfd_can,n_crit_can,flow_can = fitted['candidate'][i]
+            grid = linspace(0,reference[i,0,:].max(),100)
+            rmse = sqrt(mean((mfd_ref(grid)-mfd_can(grid))**2))
+            row = {'n_crit_reference': n_crit_ref,
+                   'n_crit_candidate': n_crit_can,
+                   'n_crit_error': abs(n_crit_can-n_crit_ref)/n_crit_ref,
+                   'flow_max_reference': flow_ref,
+                   'flow_max_candidate': flow_can,
+                   'flow_max_error': abs(flow_can-flow_ref)/flow_ref,
+                   'rmse': rmse,
+                   'rmse_error': rmse/flow_ref,
+                   }
+            row['trusted'] = max(row['n_crit_error'],row['flow_max_error'],row['rmse_error']) <= tolerance
+            rows.append(row)
+
+        return DataFrame(rows,index=[f'Region {i}' for i in range(self.n_regions)]).round(3)
+
     def get_r(self,prediction_horizon, mode = 'density'):
         '''get method for the trajectory composed by the regional n_crit points used by DeePC
         
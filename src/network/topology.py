@@ -0,0 +1,234 @@
+import os,sys,hashlib
+from zipfile import BadZipFile
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import sumolib
+from numpy import array,asarray,zeros,cumsum,concatenate,savez,load
+from scipy.sparse import csr_matrix
+
+class Topology():
+    '''Compiled topology of a SUMO network, cached as a .topology.npz next to the .net.xml.
+
+        The arrays needed to build the Network (edges, nodes, neighbours, traffic lights) are
+        extracted once from sumolib and stored in a compact binary file, invalidated by the md5
+        of the .net.xml. The sumolib network is only read when the cache is stale or when an
+        object needs it (get_net).
+
+        Attributes:
+            net_path : path of the .net.xml file                      str().
+            cache_path : path of the cached topology                  str().
+            net_hash : md5 of the .net.xml the topology was compiled from  str().
+            edge_ids : the edge ids                                   np.array().
+            edge_from, edge_to : positions of the from/to node of each edge in node_ids  np.array().
+            edge_length : length of each edge [m]                     np.array().
+            edge_lanes : number of lanes of each edge                 np.array().
+            edge_speed : maximum speed of each edge [m/s]             np.array().
+            edge_neighbours_ptr, edge_neighbours : CSR of the edges sharing a node with each edge  np.array().
+            edge_successors_ptr, edge_successors : CSR of the edges connected to the end of each edge  np.array().
+            edge_successors_allowed : the vehicle classes allowed on both lanes of at least one lane
+                connection of each entry of edge_successors, space separated  np.array().
+            node_ids : the node ids                                   np.array().
+            node_type : the type of each node                         np.array().
+            node_coords : (n_nodes x 2) coordinates of each node      np.array().
+            node_incoming_ptr, node_incoming : CSR of the incoming edges of each node  np.array().
+            node_outgoing_ptr, node_outgoing : CSR of the outgoing edges of each node  np.array().
+            node_neighbours_ptr, node_neighbours : CSR of the neighbouring nodes of each node  np.array().
+            tls_ids : the traffic light ids                           np.array().
+            tls_program : id of the program of each traffic light in the .net.xml  np.array().
+            tls_phase_ptr, tls_phase_duration, tls_phase_state : CSR of the phases of each program  np.array().
+            tls_link_ptr, tls_link_index, tls_link_in, tls_link_out, tls_link_via : CSR of the links
+                controlled by each traffic light, their index and their incoming, outgoing and internal lane  np.array().
+    '''
+
+    VERSION = 5
+    ARRAYS = ['edge_ids','edge_from','edge_to','edge_length','edge_lanes','edge_speed',
+              'edge_neighbours_ptr','edge_neighbours','edge_successors_ptr','edge_successors','edge_successors_allowed',
+              'node_ids','node_type','node_coords',
+              'node_incoming_ptr','node_incoming','node_outgoing_ptr','node_outgoing',
+              'node_neighbours_ptr','node_neighbours','tls_ids',
+              'tls_program','tls_phase_ptr','tls_phase_duration','tls_phase_state',
+              'tls_link_ptr','tls_link_index','tls_link_in','tls_link_out','tls_link_via']
+
+    def __init__(self,net_path,arrays = {},net = None):
+        self.net_path = net_path
+        self.cache_path = Topology.get_cache_path(net_path)
+        self.net = net
+        for name in Topology.ARRAYS:
+            setattr(self,name,arrays[name])
+        self.net_hash = str(arrays['net_hash'])
+        self.edges_encoding = {edgeid: i for i,edgeid in enumerate(self.edge_ids.tolist())}
+        self.nodes_encoding = {nodeid: i for i,nodeid in enumerate(self.node_ids.tolist())}
+        self.tls_encoding = {tlsid: i for i,tlsid in enumerate(self.tls_ids.tolist())}
+
+    @staticmethod
+    def get_cache_path(net_path):
+        return net_path[:-len('.net.xml')]+'.topology.npz' if net_path.endswith('.net.xml') else net_path+'.topology.npz'
+
+    @staticmethod
+    def get_hash(net_path):
+        '''Returns the md5 of the .net.xml together with the cache format version'''
+        md5 = hashlib.md5(str(Topology.VERSION).encode())
+        with open(net_path,'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20),b''):
+                md5.update(chunk)
+        return md5.hexdigest()
+
+    @classmethod
+    def load(cls,net_path):
+        '''Returns the topology of the network, from the cache if it matches the .net.xml, compiling and caching it otherwise'''
+        net_hash = cls.get_hash(net_path)
+        cache_path = cls.get_cache_path(net_path)
+        if os.path.exists(cache_path):
+            try:
+                with load(cache_path,allow_pickle=False) as cached:
+                    if str(cached['net_hash']) == net_hash:
+                        return cls(net_path,{name: cached[name] for name in cls.ARRAYS+['net_hash']})
+            except (OSError,KeyError,ValueError,BadZipFile):   # unreadable, truncated or outdated cache, compiled again below
+                pass
+        topology = cls.compile(net_path,net_hash)
+        topology.save()
+        return topology
+
+    @classmethod
+    def compile(cls,net_path,net_hash = None):
+        '''Extracts the topology from the sumolib network'''
+        net = sumolib.net.readNet(net_path,withPrograms=True)   # the tlLogic programs are skipped otherwise
+        edges = net.getEdges()
+        nodes = net.getNodes()
+        edges_encoding = {edge.getID(): i for i,edge in enumerate(edges)}
+        nodes_encoding = {node.getID(): i for i,node in enumerate(nodes)}
+
+        edge_neighbours = []
+        for edge in edges:
+            neighbours = set()
+            for node in [edge.getFromNode(),edge.getToNode()]:
+                neighbours.update(edges_encoding[other.getID()] for other in node.getIncoming()+node.getOutgoing())
+            neighbours.discard(edges_encoding[edge.getID()])
+            edge_neighbours.append(sorted(neighbours))
+
+        arrays = {'net_hash': net_hash if net_hash is not None else cls.get_hash(net_path),
+                  'edge_ids': array([edge.getID() for edge in edges],dtype=str),
+                  'edge_from': array([nodes_encoding[edge.getFromNode().getID()] for edge in edges],dtype=int),
+                  'edge_to': array([nodes_encoding[edge.getToNode().getID()] for edge in edges],dtype=int),
+                  'edge_length': array([edge.getLength() for edge in edges],dtype=float),
+                  'edge_lanes': array([edge.getLaneNumber() for edge in edges],dtype=int),
+                  'edge_speed': array([edge.getSpeed() for edge in edges],dtype=float),
+                  'node_ids': array([node.getID() for node in nodes],dtype=str),
+                  'node_type': array([node.getType() for node in nodes],dtype=str),
+                  'node_coords': array([node.getCoord()[:2] for node in nodes],dtype=float).reshape(len(nodes),2),
+                  'tls_ids': array([tls.getID() for tls in net.getTrafficLights()],dtype=str),
+                  }
+        arrays['edge_neighbours_ptr'],arrays['edge_neighbours'] = cls.to_csr(edge_neighbours)
+        successors = [sorted(edge.getOutgoing().items(),key=lambda item: edges_encoding[item[0].getID()]) for edge in edges]
+        arrays['edge_successors_ptr'],arrays['edge_successors'] = cls.to_csr([[edges_encoding[other.getID()] for other,_ in row] for row in successors])
+        arrays['edge_successors_allowed'] = array([' '.join(sorted(set().union(*[conn.getFromLane().getPermissions() & conn.getToLane().getPermissions() for conn in conns])))
+                                                   for row in successors for _,conns in row],dtype=str)
+        arrays['node_incoming_ptr'],arrays['node_incoming'] = cls.to_csr([[edges_encoding[edge.getID()] for edge in node.getIncoming()] for node in nodes])
+        arrays['node_outgoing_ptr'],arrays['node_outgoing'] = cls.to_csr([[edges_encoding[edge.getID()] for edge in node.getOutgoing()] for node in nodes])
+        arrays['node_neighbours_ptr'],arrays['node_neighbours'] = cls.to_csr([[nodes_encoding[other.getID()] for other in node.getNeighboringNodes(outgoingNodes=True, incomingNodes=True)] for node in nodes])
+        arrays.update(cls.compile_tls(net.getTrafficLights()))
+        topology = cls(net_path,arrays,net)
+        topology.check_tls()
+        return topology
+
+    @classmethod
+    def compile_tls(cls,tls_list):
+        '''Extracts the static program (the first one of the .net.xml) and the controlled links of each traffic light'''
+        programs,phases,links = [],[],[]
+        for tls in tls_list:
+            programid,program = next(iter(tls.getPrograms().items()),('',None))   # sumolib programs have no getID, the id is the key
+            programs.append(programid)
+            phases.append([(phase.duration,phase.state) for phase in program.getPhases()] if program is not None else [])
+            tls_links = []
+            for inlane,outlane,index in tls.getConnections():
+                via = [conn.getViaLaneID() for conn in inlane.getOutgoing() if conn.getToLane() == outlane]
+                tls_links.append((index,inlane.getID(),outlane.getID(),via[0] if via else ''))
+            links.append(tls_links)
+
+        arrays = {'tls_program': array(programs,dtype=str)}
+        arrays['tls_phase_ptr'] = cls.to_ptr(phases)
+        arrays['tls_phase_duration'] = array([duration for tls in phases for duration,_ in tls],dtype=float)
+        arrays['tls_phase_state'] = array([state for tls in phases for _,state in tls],dtype=str)
+        arrays['tls_link_ptr'] = cls.to_ptr(links)
+        arrays['tls_link_index'] = array([link[0] for tls in links for link in tls],dtype=int)
+        for j,name in enumerate(['tls_link_in','tls_link_out','tls_link_via']):
+            arrays[name] = array([link[j+1] for tls in links for link in tls],dtype=str)
+        return arrays
+
+    @staticmethod
+    def to_ptr(rows):
+        '''Returns the CSR indptr of a list of rows'''
+        indptr = zeros(len(rows)+1,dtype=int)
+        indptr[1:] = cumsum([len(row) for row in rows])
+        return indptr
+
+    @staticmethod
+    def to_csr(rows):
+        '''Returns the (indptr, indices) CSR arrays of a list of index lists'''
+        return Topology.to_ptr(rows),array([i for row in rows for i in row],dtype=int)
+
+    def save(self):
+        '''Saves the topology next to the .net.xml, written to a temporary file first so that the
+            concurrent loads never read a partial cache'''
+        tmp_path = f'{self.cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path,'wb') as f:   # a file object, savez would append .npz to the path
+            savez(f,net_hash=self.net_hash,**{name: getattr(self,name) for name in Topology.ARRAYS})
+        os.replace(tmp_path,self.cache_path)
+
+    def get_net(self):
+        '''Returns the sumolib network, read on first use'''
+        if self.net is None:
+            self.net = sumolib.net.readNet(self.net_path,withPrograms=True)
+        return self.net
+
+    def get_edge_neighbours(self,i):
+        '''Returns the ids of the edges sharing a node with the edge in position i'''
+        return self.edge_ids[self.edge_neighbours[self.edge_neighbours_ptr[i]:self.edge_neighbours_ptr[i+1]]].tolist()
+
+    def get_successor_mask(self,vclass):
+        '''Returns the mask of the entries of edge_successors the vehicle class vclass can drive through'''
+        return array([vclass in allowed.split(' ') for allowed in self.edge_successors_allowed.tolist()],dtype=bool)
+
+    def get_successor_matrix(self,weights,mask = None):
+        '''Returns the (n_edges x n_edges) CSR matrix of the connections between edges, the entry (u, v)
+            is the weight of v, i.e. the cost of moving from u onto v. Only the connections in mask are kept if given.'''
+        n_edges = len(self.edge_ids)
+        successors,indptr = self.edge_successors,self.edge_successors_ptr
+        if mask is not None:
+            indptr = concatenate([[0],cumsum(mask)])[indptr]
+            successors = successors[mask]
+        return csr_matrix((asarray(weights,dtype=float)[successors],successors,indptr),shape=(n_edges,n_edges))
+
+    def get_node_incoming(self,i):
+        return self.edge_ids[self.node_incoming[self.node_incoming_ptr[i]:self.node_incoming_ptr[i+1]]].tolist()
+
+    def get_node_outgoing(self,i):
+        return self.edge_ids[self.node_outgoing[self.node_outgoing_ptr[i]:self.node_outgoing_ptr[i+1]]].tolist()
+
+    def get_node_neighbours(self,i):
+        return self.node_ids[self.node_neighbours[self.node_neighbours_ptr[i]:self.node_neighbours_ptr[i+1]]].tolist()
+
+    def get_tls_phases(self,i):
+        '''Returns the (duration, state) of the phases of the program of the traffic light in position i'''
+        phases = slice(self.tls_phase_ptr[i],self.tls_phase_ptr[i+1])
+        return list(zip(self.tls_phase_duration[phases].tolist(),self.tls_phase_state[phases].tolist()))
+
+    def check_tls(self):
+        '''Raises a ValueError if a traffic light has no phases, i.e. its program was not read from the .net.xml'''
+        empty = [tlsid for i,tlsid in enumerate(self.tls_ids.tolist()) if self.tls_phase_ptr[i] == self.tls_phase_ptr[i+1]]
+        if empty:
+            raise ValueError(f"No program was read for the traffic lights {empty} of {self.net_path}")
+
+    def get_tls_links(self,i):
+        '''Returns the links controlled by the traffic light in position i as traci.trafficlight.getControlledLinks,
+            a list indexed by link index of the (incoming, outgoing, internal) lanes'''
+        links = slice(self.tls_link_ptr[i],self.tls_link_ptr[i+1])
+        index = self.tls_link_index[links]
+        controlled = [[] for _ in range(int(index.max())+1 if len(index) else 0)]
+        for j,inlane,outlane,via in zip(index.tolist(),self.tls_link_in[links].tolist(),self.tls_link_out[links].tolist(),self.tls_link_via[links].tolist()):
+            controlled[j].append((inlane,outlane,via))
+        return controlled
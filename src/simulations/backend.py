@@ -0,0 +1,81 @@
+import os,sys
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import traci as traci_socket
+
+BACKENDS = ['traci','libsumo']
+DOMAINS = ['edge','lane','vehicle','trafficlight','simulation','route','junction',
+           'inductionloop','lanearea','vehicletype','person','poi','polygon','gui']
+
+class Domain():
+    '''Late-bound view of a single TraCI domain (edge, trafficlight, ...).
+
+        Functions looked up on the domain dispatch to the backend selected at call time,
+        so references taken before the simulation starts (e.g. Edge.funcs) stay valid
+        when the backend is switched.
+    '''
+
+    def __init__(self,backend,name):
+        self.backend = backend
+        self.name = name
+
+    def __getattr__(self,attr):
+        backend = self.backend
+        name = self.name
+        def dispatch(*args,**kwargs):
+            return getattr(backend.domains[name],attr)(*args,**kwargs)
+        dispatch.__name__ = attr
+        setattr(self,attr,dispatch)
+        return dispatch
+
+class Backend():
+    '''Drop-in replacement for the traci module that runs either over the TraCI socket (traci)
+        or in-process (libsumo). Both libraries expose the same API, so the rest of the code
+        keeps calling traci.edge.*, traci.trafficlight.*, traci.simulationStep, ...
+
+        Attributes:
+            name : name of the selected backend, one of BACKENDS     str().
+            module : the selected library         module.
+            domains : mapping domain name - domain object of the selected library  dict().
+            proxies : mapping domain name - Domain returned to the callers    dict().
+    '''
+
+    def __init__(self):
+        self.proxies = {name: Domain(self,name) for name in DOMAINS}
+        self.select('traci')
+
+    def select(self,name = 'traci'):
+        '''Selects the library the TraCI calls are dispatched to.
+
+            Args:
+                name: 'traci' for the socket client, 'libsumo' for the in-process library
+        '''
+        if name == 'traci':
+            module = traci_socket
+        elif name == 'libsumo':
+            try:
+                import libsumo
+            except ImportError:
+                raise ValueError("The libsumo backend requires the libsumo package, install it or set 'backend' to 'traci'")
+            module = libsumo
+        else:
+            raise ValueError(f"Backend {name} does not exist, please select one of {BACKENDS}")
+
+        self.name = name
+        self.module = module
+        self.domains = {domain: getattr(module,domain) for domain in DOMAINS if hasattr(module,domain)}
+
+    def is_libsumo(self):
+        return self.name == 'libsumo'
+
+    def __getattr__(self,attr):
+        if attr in DOMAINS:
+            return self.proxies[attr]
+        return getattr(self.module,attr)
+
+traci = Backend()
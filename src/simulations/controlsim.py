@@ -1,9 +1,13 @@
 import os,sys,json
+from inspect import signature
 import numpy as np
 from numpy import load, empty, array, ones, concat
 from simulations.simulation import Simulation
+from simulations.gridlock import GridlockDetector
 from models.linearmodel import LinearModel
-from tools.utils import Parser
+from models.theta import OnlineTheta
+from data.recorder import EdgeRecorder
+from tools.utils import Parser, iter_xml
 parent = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 sys.path.append(parent)
 
@@ -13,12 +17,16 @@ if 'SUMO_HOME' in os.environ:
 else:   
     sys.exit("please declare environment variable 'SUMO_HOME'")
 
-import traci
+from src.simulations.backend import traci
 from numpy import array,zeros,eye,tile,repeat, newaxis, unique, sum
 from pandas import DataFrame
-from lxml import etree
 from abc import ABC, abstractmethod
 
+# reductions of the regional states sampled within a control cycle when supersampling
+REDUCTIONS = {'mean': lambda samples: samples.mean(axis = 0),
+              'max': lambda samples: samples.max(axis = 0),
+              'last': lambda samples: samples[-1]}
+
 class ControlSim(Simulation):
         
     def __init__(self,network,taskparams,actuators,controlparams = {}):
@@ -39,6 +47,13 @@ class ControlSim(Simulation):
         self.density_columns = [f'Region {i}' for i in range(self.network.n_regions)]
         self.input_columns = actuators.encoding.keys()
         self.flow_columns =  [f'Region {i}' for i in range(self.network.n_regions)]
+        self.reduction = taskparams.get('supersampling_reduction','mean')
+        if self.supersampling:
+            if self.reduction not in REDUCTIONS:
+                raise ValueError(f"The supersampling reduction {self.reduction} does not exist, please select among {list(REDUCTIONS)}")
+            if not self.superfreq or self.superfreq <= 0:
+                raise ValueError("Supersampling requires a positive superfreq")
+            self.sampling_period = self.superfreq   # the state is retrieved every superfreq seconds
     
         # load the deparr.json file from self.deparr_path
         with open(self.deparr_path) as f:
@@ -74,27 +89,57 @@ class ControlSim(Simulation):
         uData = zeros((T,self.m))
         yPred = zeros((T,self.p))
         error = zeros((T,1))
+        transfers = zeros((T,self.n_regions,self.n_regions))
+        self.theta = OnlineTheta(self.network) if self.online_theta else None
+        if self.recorded:
+            n_samples = T*(increment//self.superfreq + 1) if self.supersampling else T
+            self.recorder = EdgeRecorder(os.path.join(self.output_path,'edge_state'),self.network.store.ids,self.recorded,n_samples)
+        # the optional measurements are passed to the compute_input implementations taking them as arguments
+        optional = [name for name,enabled in [('transfers',self.transfer_counter is not None),('theta',self.theta is not None)]
+                    if enabled and name in signature(self.compute_input).parameters]
         k = 0
+        k_warmup = 0 if self.warmup is None else max(1,(self.warmup-self.begin)//increment)  # steps simulated with the default inputs
+        if self.warm_started:
+            snapshot = self.load_snapshot()
+            k = k_warmup
+            data[:,:,:k] = snapshot['data'][:,:,:k]
+            uData[:k], yPred[:k], error[:k] = snapshot['uData'][:k], snapshot['yPred'][:k], snapshot['error'][:k]
+            if 'transfers' in snapshot:
+                transfers[:k] = snapshot['transfers'][:k]
+            if self.theta is not None and 'theta' in snapshot:
+                self.theta.set_snapshot(snapshot['theta'])
+            self.current_step = self.begin + k*increment
+
+        self.failed = False
+        self.actuators.reset_actuation()   # SUMO starts from the default inputs
+        detector = GridlockDetector(self.network.regions.regions,self.gridlock_patience) if self.gridlock_patience is not None else None
 
         demand = array([sum(self.demand[:, 4, i*cycle_duration:(i+1)*cycle_duration], axis=1) for i in range(T)])
         demand = concat([demand, ones((180, self.n_regions))]) # add the demand for the last N time steps
         
         while self.current_step < self.begin+self.T:
-            traci.simulationStep(self.current_step)
-            
-            results = self.network.get_state(byregion = True, cols = self.variables) # get state of each network region e.g. for density and flow
+            if k == k_warmup and self.warmup is not None and not self.warm_started:
+                self.save_snapshot({'data': data[:,:,:k], 'uData': uData[:k], 'yPred': yPred[:k], 'error': error[:k], 'transfers': transfers[:k],
+                                    **({'theta': self.theta.get_snapshot()} if self.theta is not None else {})})
+            results = self.sample_cycle(self.current_step,increment) # get state of each network region e.g. for density and flow
             data[:,self.variablesIndexes,k:(k+1)] = results[:, :, newaxis] # store results in data
             yData = data[:,self.outputIndexes[0],:]
+            if self.transfer_counter is not None:
+                transfers[k] = self.transfer_counter.get_transfers()   # vehicles that crossed between the regions during the last cycle
 
             u_target = np.ones(self.n_regions)
             A, B, C, d = self.linear_model.linearize(cycle_duration, self.r, u_target)
-            u, y = self.compute_input(k, demand, self.controller, self.controller.name,  
-                                      uData, yData, yPred, self.m, self.p, self.r, self.controller.safety[0], self.controller.safety[1])
+            if k < k_warmup:   # uncontrolled warm-up, shared by all the runs through the snapshot
+                u, y = tile(self.actuators.get_uhat(),self.m), zeros(self.p)
+            else:
+                u, y = self.compute_input(k, demand, self.controller, self.controller.name,  
+                                          uData, yData, yPred, self.m, self.p, self.r, self.controller.safety[0], self.controller.safety[1],
+                                          **{name: measurements for name,measurements in [('transfers',transfers[:k+1]),('theta',self.theta)] if name in optional})
 
             uData[k:(k+1)] = u
             yPred[k:(k+1)] = y
 
-            if self.controller.name != 'NoControl':
+            if self.controller.name != 'NoControl' and k >= k_warmup:
                 self.actuators.set_inputs(u)
 
             distance = y - self.r
@@ -103,13 +148,55 @@ class ControlSim(Simulation):
             self.current_step += increment
             k += 1
 
+            density, flow = results[:,self.variables.index('density')], results[:,self.variables.index('flow')]
+            if detector is not None and detector.update(density,flow,len(traci.simulation.getPendingVehicles())):
+                print(f'Gridlock detected at step {self.current_step-increment} in regions {detector.get_jammed(density)}, aborting the run')
+                self.failed = True
+                data, uData, yPred, error, transfers = data[:,:,:k], uData[:k], yPred[:k], error[:k], transfers[:k]
+                break
+
+        if self.recorder is not None:
+            self.recorder.close()
+        self.actuation = self.actuators.get_actuation()
+        print(f"Actuation: {self.actuation['sent']} commands sent, {self.actuation['suppressed']} suppressed")
+        if 'rerouted' in self.actuation:
+            print(f"Route guidance: {self.actuation['rerouted']} vehicles rerouted, {self.actuation['reroute_failed']} routes rejected by SUMO")
+
         #Output creation
         self.output = {f"{var}_results": DataFrame(data[:,self.cols.index(var),:].T,columns=[f'Region {i}' for i in range(self.n_regions)]) for var in self.variables}
         self.output['input_results'] = DataFrame(uData, columns=self.input_columns)
         self.output['error_results'] = DataFrame(error, columns=['Error'])
+        self.output['actuation_results'] = DataFrame([self.actuation])
+        if self.transfer_counter is not None:
+            self.output['transfer_results'] = DataFrame(transfers.reshape(len(transfers),-1),
+                                                        columns=[f'Region {i} to Region {j}' for i in range(self.n_regions) for j in range(self.n_regions)])
         self.pred = {f"{var}_prediction_results": DataFrame(yPred[:,self.cols.index(var)*self.n_regions:(1 + self.cols.index(var))*self.n_regions],columns=[f'Region {i}' for i in range(self.n_regions)]) for var in self.output_type}
         self.output.update(self.pred)
 
+    def sample_cycle(self,step,increment):
+        '''Advances the simulation to step and returns the (n_regions x len(variables)) state of the cycle ending there.
+
+            With supersampling the state is sampled every superfreq seconds within the cycle and the
+            samples are reduced with the supersampling reduction, otherwise it is sampled once at step.
+        '''
+        steps = [step]
+        if self.supersampling:
+            steps = [t for t in range(step-increment+self.superfreq,step,self.superfreq) if t > self.begin] + steps
+        samples = []
+        collected = self.get_collected()
+        recorded = [collected.index(var) for var in self.recorded]
+        for t in steps:
+            traci.simulationStep(t)
+            if self.recorder is None:
+                samples.append(self.network.get_state(byregion = True, cols = self.variables))
+            else:   # the edge state is retrieved once, recorded and averaged over the regions
+                edge_state = self.network.get_state(cols = collected)
+                self.recorder.record(t,edge_state[:,recorded])
+                samples.append(self.network.store.aggregate(edge_state[:,:len(self.variables)],self.variables))
+            if self.theta is not None:
+                self.theta.update()
+        return REDUCTIONS[self.reduction](array(samples)) if self.supersampling else samples[0]
+
     @abstractmethod
     def compute_input(self):
         '''Computes the input for the controller. This function is called every cycle_duration seconds.'''
@@ -151,26 +238,32 @@ class ControlSim(Simulation):
         return linear_model_instance
 
     def compute_metrics(self):
+        '''Computes the average trip metrics from tripinfo.xml, the only output they need.'''
+        if 'tripinfo' not in self.outputs:
+            raise ValueError("The metrics are computed from tripinfo.xml, please add 'tripinfo' to the outputs")
     
-        parser = etree.XMLParser(recover=True)
-        tree = etree.parse(self.output_path+"tripinfo.xml",parser= parser)
-        root = tree.getroot()
         columns = ['travel_time','waiting_time','C0_abs','C02_abs','HC_abs','PMx_abs','NOx_abs','fuel_abs']
-        values = zeros((len(root),len(columns)))
-        i = 0 
-        for trip in root:
-            emissions = trip.__getitem__(0)
-            values[i,:] = array([trip.values()[10],trip.values()[12],
-                                emissions.values()[0],emissions.values()[1],
-                                emissions.values()[2],emissions.values()[3],
-                                emissions.values()[4],emissions.values()[5]]).astype(float)
-            i += 1
+        emission_attributes = ['CO_abs','CO2_abs','HC_abs','PMx_abs','NOx_abs','fuel_abs']
+        trips = []
+        arrivals = []
+        for trip in iter_xml(self.get_output_file('tripinfo'),'tripinfo'):
+            emissions = trip.find('emissions')
+            trips.append([trip.get('duration'),trip.get('waitingTime')] +
+                         [emissions.get(attribute) for attribute in emission_attributes])
+            arrivals.append(trip.get('arrival'))
+        values = array(trips,dtype=float).reshape(-1,len(columns))
+        # the warm started runs only write the trips ended after the snapshot, those of the warm-up are shared
+        if self.snapshot_saved:
+            arrivals = array(arrivals,dtype=float)
+            self.save_warmup_trips(values[(arrivals >= 0) & (arrivals <= self.snapshot_time)])   # the unfinished trips arrive at -1
+        elif self.warm_started:
+            values = concat([self.load_warmup_trips(),values])
         values =array([values[:,0]/60,values[:,1]/60,
                        values[:,2]/1000,values[:,3]/1000,
                        values[:,4]/1000,values[:,5]/1000,
                        values[:,6]/1000,values[:,7]/1000]).T
         metrics = DataFrame(values,columns=columns).mean().round(2)
-        metrics['nvehicles'] = int(len(root))
+        metrics['nvehicles'] = int(len(values))
         self.output['metrics'] = metrics
         
         
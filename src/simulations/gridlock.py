@@ -0,0 +1,44 @@
+from numpy import array
+
+class GridlockDetector():
+    '''Detects a gridlocked network from the regional state measured every control cycle.
+
+        A cycle is locked when a region is jammed (density close to its jam density Region.n_max)
+        or stalled (vehicles on it but no flow), and the number of vehicles waiting to be
+        inserted does not decrease. The network is gridlocked after patience locked cycles in a row.
+
+        Attributes:
+            n_max : jam density of each region                         np.array().
+            patience : locked cycles in a row before declaring a gridlock  int.
+            jam_ratio : fraction of n_max above which a region is jammed  float.
+            locked : locked cycles in a row so far                      int.
+            waiting : vehicles waiting for insertion at the last cycle  int.
+    '''
+
+    def __init__(self,regions,patience = 15,jam_ratio = 0.9):
+        self.n_max = array([region.n_max for region in regions])
+        self.patience = patience
+        self.jam_ratio = jam_ratio
+        self.locked = 0
+        self.waiting = 0
+
+    def update(self,density,flow,waiting):
+        '''Updates the detector with the state of a cycle, returns True if the network is gridlocked.
+
+            Args:
+                density: the density of each region
+                flow: the flow of each region
+                waiting: the number of vehicles waiting to be inserted
+        '''
+        jammed = density >= self.jam_ratio*self.n_max
+        stalled = (density > 0) & (flow == 0)
+        if (jammed | stalled).any() and waiting >= self.waiting:
+            self.locked += 1
+        else:
+            self.locked = 0
+        self.waiting = waiting
+        return self.locked >= self.patience
+
+    def get_jammed(self,density):
+        '''Returns the regions at their jam density'''
+        return [i for i,value in enumerate(density >= self.jam_ratio*self.n_max) if value]
@@ -9,7 +9,7 @@ if 'SUMO_HOME' in os.environ:
 else:   
     sys.exit("please declare environment variable 'SUMO_HOME'")
 
-import traci
+from src.simulations.backend import traci
 from numpy import zeros
 from data.data import Data
 
@@ -22,6 +22,7 @@ class MFDSim(Simulation):
         self.n_edges = self.network.get_n_edges()
         self.scale = str(2)
         self.variables = ['density','flow']
+        self.sampling_period = self.freq
 
     def run(self):
         
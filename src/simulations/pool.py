@@ -0,0 +1,62 @@
+import time
+from src.simulations.backend import traci
+
+class SumoPool():
+    '''Keeps one SUMO instance alive across consecutive simulations.
+
+        The first simulation spawns SUMO with traci.start, the following ones reset it with
+        traci.load and their own options (seed, scale, outputs, ...), so the process spawn is
+        paid once. SUMO flushes the outputs of a run when the next one is loaded or when the
+        pool is closed, the metrics of a run must therefore be computed after that point.
+
+        Attributes:
+            binary : the SUMO binary of the running instance        str().
+            backend : the backend the instance was started with     str().
+            running : True if a SUMO instance is alive              bool.
+            spawn_time : wall time of the first traci.start [s]     float.
+            load_times : wall time of every traci.load [s]          list().
+    '''
+
+    def __init__(self):
+        self.binary = None
+        self.backend = None
+        self.running = False
+        self.spawn_time = 0
+        self.load_times = []
+
+    def start(self,binary,options = [],backend = 'traci'):
+        '''Starts SUMO with the given options, or reloads the running instance with them.
+
+            Args:
+                binary: path of the SUMO binary
+                options: the command line options of the run, without the binary
+                backend: the backend used, see Backend.select
+        '''
+        if self.running and (binary != self.binary or backend != self.backend):
+            self.close()
+        start = time.perf_counter()
+        if self.running:
+            traci.load(options)
+            self.load_times.append(time.perf_counter() - start)
+        else:
+            traci.select(backend)
+            traci.start([binary] + options)
+            self.spawn_time = time.perf_counter() - start
+            self.binary = binary
+            self.backend = backend
+            self.running = True
+
+    def close(self):
+        '''Closes the SUMO instance, flushing the outputs of the last run'''
+        if self.running:
+            traci.close()
+            self.running = False
+
+    def get_saved_time(self):
+        '''Returns the startup time saved by reloading instead of restarting SUMO [s]'''
+        return round(self.spawn_time*len(self.load_times) - sum(self.load_times),2)
+
+    def summary(self):
+        '''Prints the startup time spent and saved by the pool'''
+        print(f"SUMO spawned in {self.spawn_time:.2f}s and reloaded {len(self.load_times)} times "
+              f"({sum(self.load_times):.2f}s), startup time saved: {self.get_saved_time()}s")
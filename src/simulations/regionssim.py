@@ -8,7 +8,7 @@ if 'SUMO_HOME' in os.environ:
 else:   
     sys.exit("please declare environment variable 'SUMO_HOME'")
 
-import traci
+from src.simulations.backend import traci
 from numpy import average,zeros
 from data.data import Data
 
@@ -1,4 +1,4 @@
-import os,sys
+import os,sys,json,hashlib
 from multiprocessing.pool import ThreadPool
 from numpy import zeros
 from pandas import concat , DataFrame
@@ -11,8 +11,13 @@ else:
     sys.exit("please declare environment variable 'SUMO_HOME'")
     
 import sumolib
-import traci
+from src.simulations.backend import traci
 from abc import ABC, abstractmethod
+from tools.utils import pickler
+from network.flowcounter import FlowCounter,TransferCounter
+from data.recorder import RECORDED
+
+OUTPUTS = ['tripinfo','vehroute','emission','edgedata']   # SUMO outputs that can be enabled from the taskparams
 
 class Simulation(ABC):
     """Abstract class for simulations."""
@@ -41,11 +46,38 @@ class Simulation(ABC):
         self.Tini = taskparams['Tini']
         self.seed = taskparams['seed']
         self.actuator_type = taskparams['actuators']
+        self.backend = taskparams.get('backend','traci')   # 'traci' (socket) or 'libsumo' (in-process)
+        self.collector = taskparams.get('collector','threaded') # how the regional state is retrieved, see Network.init_collector
+        if self.collector == 'meandata' and self.backend == 'libsumo':
+            # the in-process SUMO would write to the socket drained by a thread of the same process
+            raise ValueError("The meandata collector streams SUMO outputs to a socket and can deadlock with the libsumo backend, set 'backend' to 'traci' or use another collector")
+        self.collector_timing = None   # per-step retrieval time of the collector, set by close_traci
+        self.variables = ['density','flow']
+        self.exact_flow = bool(taskparams.get('exact_flow',False))   # counts the flow with induction loops at the edge entries, see FlowCounter
+        self.flow_counter = None
+        self.transfers = bool(taskparams.get('transfers',False))   # counts the vehicles crossing between regions, see TransferCounter
+        self.transfer_counter = None
+        record_edges = taskparams.get('record_edges')   # edge variables recorded at each sample of control runs, True for RECORDED
+        self.recorded = list(RECORDED) if record_edges is True else list(record_edges or [])
+        self.recorder = None
+        self.online_theta = bool(taskparams.get('online_theta',False))   # estimates Theta from the live vehicles during control runs, see OnlineTheta
+        self.gridlock_patience = taskparams.get('gridlock_patience')   # locked control cycles before aborting a run, None disables the detection
+        self.failed = False   # set by the runs aborted early, e.g. on gridlock
+        self.sampling_period = self.cycle_duration   # time between two network.get_state calls, the 'meandata' aggregation period
+        self.warmup = taskparams.get('warmup')   # time at which the uncontrolled warm-up ends, None disables the snapshots
+        self.warm_started = False
+        self.snapshot_saved = False   # set by the run that saved the snapshot, it then keeps the trips of the warm-up
+        self.snapshot_time = None   # simulation time of the snapshot saved or loaded [s]
+        self.pool = None
+        self.outputs = ['tripinfo'] if taskparams.get('outputs') is None else list(taskparams['outputs'])  # only what is consumed, tripinfo feeds compute_metrics, [] disables them all
+        for output in self.outputs:
+            if output not in OUTPUTS:
+                raise ValueError(f"Output {output} does not exist, please select among {OUTPUTS}")
+        self.mesosim = bool(taskparams.get('mesosim',False))   # SUMO mesoscopic model, faster but coarser
+        self.output_extension = '.xml.gz' if taskparams.get('compress_outputs') else '.xml'   # SUMO gzips the outputs ending in .gz
 
-        additional = self.additional_files.split(',')
-        fulladd = [f'./dep/sumo_files/{self.network.name}/additional/{add},' for add in additional]
-        self.additional_path = ''.join(fulladd)
-        self.additional_path = self.additional_path[:-1]
+        additional = [add for add in self.additional_files.split(',') if add != '']
+        self.additional_path = ','.join(f'./dep/sumo_files/{self.network.name}/additional/{add}' for add in additional)
         self.T = int(self.end)-int(self.begin)
 
         if self.taskparams['taskname'] != 'parameterstudy':
@@ -53,6 +85,8 @@ class Simulation(ABC):
         else:
             self.output_path = f'./out/{self.network.name}/{self.id}/simulation 0/'
 
+        self.snapshot_path = self.get_snapshot_path() if self.warmup is not None else None
+
     
     def generate_additional_edge_data(self):
         """Dynamically generates additional_edge_data.xml and appends it to self.additional_path."""
@@ -63,7 +97,7 @@ class Simulation(ABC):
         # Define file paths dynamically
         additional_file_path = os.path.join(self.output_path, "additional_edge_data.xml")
         # edge_data_file_path = os.path.join(self.output_path, "edge_data.xml")
-        edge_data_file_path = "edge_data_new.xml"
+        edge_data_file_path = "edge_data_new" + self.output_extension
 
         # Define the XML content with the correct file reference and period
         # additional_file_content = f"""<additional>
@@ -80,15 +114,25 @@ class Simulation(ABC):
         # print(f"Generated additional file: {additional_file_path}")
 
         # Append the newly created file path to self.additional_path
-        self.additional_path = additional_file_path
+        self.add_additional(additional_file_path)
         # print(f"Current self.additional_path is: {self.additional_path}")
 
         return additional_file_path  # Return the generated path
         
-    def start_traci(self):
+    def add_additional(self,path):
+        '''Appends an additional file to the ones loaded by SUMO'''
+        if path not in self.additional_path.split(','):
+            self.additional_path = ','.join(filter(None,[self.additional_path,path]))
+
+    def start_traci(self,pool = None):
         '''This method starts the SUMO simulation.
+
+            Args:
+                pool: a SumoPool, if given the running SUMO instance is reloaded instead of spawning a new one
         '''
         if self.gui:
+            if self.backend == 'libsumo':
+                raise ValueError("The libsumo backend runs SUMO in-process and cannot open sumo-gui, set 'gui' to 0 or 'backend' to 'traci'")
             sumoBinary = sumolib.checkBinary('sumo-gui')
         else:
             sumoBinary = sumolib.checkBinary('sumo')
@@ -122,54 +166,147 @@ class Simulation(ABC):
             #             counter += 1
             #             pass
                 
-        self.generate_additional_edge_data()
-        if self.additional_path == '': 
-            traci.start([sumoBinary,'-c', self.sumocfg_path,
-                        '--route-files',self.routing_path,
-                        # '--threads',str(cores),
-                        '--threads', str(1), # single-thread ensures deterministic runs
-                        '--seed',str(self.seed),
-                        '--tripinfo-output',f'{self.output_path}/tripinfo.xml',
-                        '--tripinfo-output.write-unfinished','true',
-                        '--vehroute-output',f'{self.output_path}/routes.xml',
-                        '--emission-output',f'{self.output_path}/emission.xml', # This one can get big.
-                        '--device.emissions.period','3',
-                        '--begin',str(self.begin),
-                        '--end',str(self.end),
-                        '--max-num-teleports', '0',
-                        '--time-to-teleport',str(self.time_to_teleport),
-                        '--scale',str(self.scale),
-                        # '--device.rerouting.threads',str(cores),
-                        '--device.rerouting.threads', str(1), # single-thread ensures deterministic runs
-                        ])    
-        else:        
-            traci.start([sumoBinary,'-c', self.sumocfg_path,
-                        '--route-files',self.routing_path,
-                        '--additional-files',self.additional_path,
-                        # '--threads',str(cores),
-                        '--threads', str(1), # single-thread ensures deterministic runs
-                        '--seed',str(self.seed),
-                        '--tripinfo-output',f'{self.output_path}/tripinfo.xml',
+        if 'edgedata' in self.outputs:
+            self.generate_additional_edge_data()
+        if self.network.regions is not None and self.collector == 'meandata':
+            # SUMO streams the edgeData to the collector from its start
+            self.network.init_collector(self.collector,self.get_collected(),period = self.sampling_period,begin = self.begin)
+            self.add_additional(self.network.regions.collector.write_additional(os.path.join(self.output_path,'additional_meandata.xml')))
+        elif self.network.regions is not None and self.exact_flow:
+            # the loops aggregate over the sampling period, they must be loaded by SUMO at start
+            self.flow_counter = FlowCounter(self.network.store,self.sampling_period)
+            self.add_additional(self.flow_counter.write_additional(os.path.join(self.output_path,'additional_flow.xml')))
+        if self.network.regions is not None and self.transfers:
+            # aggregated over the control cycle, the sampling period of the runs without one
+            self.transfer_counter = TransferCounter(self.network.store,self.network.topology,self.cycle_duration or self.sampling_period)
+            self.add_additional(self.transfer_counter.write_additional(os.path.join(self.output_path,'additional_transfers.xml')))
+
+        self.pool = pool
+        if pool is not None:
+            pool.start(sumoBinary,self.get_sumo_options(),self.backend)
+        else:
+            traci.select(self.backend)
+            traci.start([sumoBinary] + self.get_sumo_options())
+        self.network.set_last_vehicles([set() for _ in self.edges])   # the network may be reused from a previous run
+        self.snapshot_saved = False
+        self.warm_started = self.snapshot_path is not None and os.path.exists(self.snapshot_path+'.pkl')
+        if self.warm_started:
+            print(f'Warm start from snapshot {self.snapshot_path}')
+            traci.simulation.loadState(self.snapshot_path+'.xml.gz')
+        if self.network.regions is not None and self.collector != 'meandata':
+            self.network.init_collector(self.collector,self.get_collected(),flow_counter = self.flow_counter)
+        if self.transfer_counter is not None:
+            self.transfer_counter.subscribe()
+
+    def get_collected(self):
+        '''Returns the edge variables retrieved by the collector: the variables followed by the other recorded ones'''
+        return self.variables + [var for var in self.recorded if var not in self.variables]
+
+    def get_sumo_options(self):
+        '''Returns the command line options passed to SUMO (without the binary).'''
+        options = ['-c', self.sumocfg_path,
+                   '--route-files',self.routing_path]
+        if self.additional_path != '':
+            options += ['--additional-files',self.additional_path]
+        options += [# '--threads',str(cores),
+                    '--threads', str(1), # single-thread ensures deterministic runs
+                    '--seed',str(self.seed),
+                    '--begin',str(self.begin),
+                    '--end',str(self.end),
+                    '--max-num-teleports', '0',
+                    '--time-to-teleport',str(self.time_to_teleport),
+                    '--scale',str(self.scale),
+                    # '--device.rerouting.threads',str(cores),
+                    '--device.rerouting.threads', str(1), # single-thread ensures deterministic runs
+                    ]
+        if self.warmup is not None:
+            options += ['--save-state.rng','true']   # a warm start resumes the random draws of the run that saved the snapshot
+        if self.mesosim:
+            options += ['--mesosim','true',
+                        '--meso-junction-control','true']  # traffic lights are kept, otherwise the tls actuators have no effect
+        if 'tripinfo' in self.outputs:
+            options += ['--tripinfo-output',self.get_output_file('tripinfo'),
                         '--tripinfo-output.write-unfinished','true',
-                        '--vehroute-output',f'{self.output_path}/routes.xml',
-                        '--emission-output',f'{self.output_path}/emission.xml',
-                        '--device.emissions.period','3',
-                        '--begin',str(self.begin),
-                        '--end',str(self.end),
-                        '--max-num-teleports', '0',
-                        '--time-to-teleport',str(self.time_to_teleport),
-                        '--scale',str(self.scale),
-                        # '--device.rerouting.threads',str(cores),
-                        '--device.rerouting.threads', str(1), # single-thread ensures deterministic runs
-                        ])
+                        '--device.emissions.probability','1']  # adds the emissions of each trip to tripinfo.xml
+        if 'vehroute' in self.outputs:
+            options += ['--vehroute-output',self.get_output_file('routes')]
+        if 'emission' in self.outputs:
+            options += ['--emission-output',self.get_output_file('emission'), # This one can get big.
+                        '--device.emissions.period','3']
+        return options
         
+    def get_output_file(self,name):
+        '''Returns the path of the SUMO output name (tripinfo, routes, emission, edge_data_new), compressed if compress_outputs is set'''
+        return os.path.join(self.output_path,name+self.output_extension)
+
+    def get_snapshot_path(self):
+        '''Returns the path (without extension) of the warm-up snapshot.
+
+            The snapshot is keyed by everything that determines the uncontrolled warm-up:
+            network, route file, seed, scale, the sampling grid up to the warm-up time, how the
+            state is collected (the loops of exact_flow and the meandata collector are in the state)
+            and the outputs (the emissions devices are in the state).
+        '''
+        if not self.begin < self.warmup < self.end:
+            raise ValueError(f"The warm-up time {self.warmup} must be between begin {self.begin} and end {self.end}")
+        key = {'net': self.network.name,
+               'routing': self.routing_path,
+               'additionals': self.additional_files,
+               'seed': self.seed,
+               'scale': self.scale,
+               'begin': self.begin,
+               'warmup': self.warmup,
+               'control_cycle': self.cycle_duration,
+               'freq': self.freq,
+               'time_to_teleport': self.time_to_teleport,
+               'mesosim': self.mesosim,
+               'supersampling': [self.superfreq,self.taskparams.get('supersampling_reduction','mean')] if self.supersampling else None,
+               'exact_flow': self.exact_flow,
+               'collector': self.collector,
+               'outputs': sorted(self.outputs),
+               }
+        digest = hashlib.md5(json.dumps(key,sort_keys=True).encode()).hexdigest()[:16]
+        return f'./out/{self.network.name}/snapshots/{digest}'
+
+    def save_snapshot(self,data = {}):
+        '''Saves the SUMO state together with the data measured during the warm-up.
+
+            Args:
+                data: the measurements collected so far, returned by load_snapshot on a warm start
+        '''
+        os.makedirs(os.path.dirname(self.snapshot_path),exist_ok=True)
+        traci.simulation.saveState(self.snapshot_path+'.xml.gz')
+        self.snapshot_time = traci.simulation.getTime()
+        self.snapshot_saved = True
+        data = dict(data)
+        data['last_vehicles'] = self.network.get_last_vehicles()
+        data['time'] = self.snapshot_time
+        pickler().save(data,self.snapshot_path+'.pkl')   # written last, its presence marks a complete snapshot
+
+    def load_snapshot(self):
+        '''Returns the data saved with the snapshot the simulation was warm started from.'''
+        data = pickler().load(self.snapshot_path+'.pkl')
+        self.network.set_last_vehicles(data.pop('last_vehicles'))
+        self.snapshot_time = data.pop('time')
+        return data
+
+    def save_warmup_trips(self,trips):
+        '''Saves with the snapshot the trips ended during the warm-up, missing from the tripinfo of the warm started runs'''
+        pickler().save(trips,self.snapshot_path+'.trips.pkl')
+
+    def load_warmup_trips(self):
+        '''Returns the trips ended during the warm-up, saved by the run that took the snapshot'''
+        path = self.snapshot_path+'.trips.pkl'
+        if not os.path.exists(path):
+            raise ValueError(f"The warm-up trips of the snapshot {self.snapshot_path} are saved with the metrics of the run that took it, please compute them first")
+        return pickler().load(path)
+
     def close_traci(self):
-        '''This method ends the SUMO simulation.'''
-        try:
-            os.remove(f'{self.output_path}/emission.xml') # The emission.xml is removed because it weights too much, the info is contained in tripinfo.xml
-        except:
-            pass
-        traci.close()
+        '''This method ends the SUMO simulation, with a pool the instance is kept alive for the next run.'''
+        self.collector_timing = self.network.get_collector_timing()
+        self.network.close_collector()
+        if self.pool is None:
+            traci.close()
 
     @abstractmethod
     def run(self):
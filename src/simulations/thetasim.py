@@ -1,6 +1,6 @@
 import os,sys
 from simulations.simulation import Simulation
-from models.theta import Theta
+from models.theta import OnlineTheta
 from src.data.data import Data
 
 if 'SUMO_HOME' in os.environ:
@@ -9,26 +9,27 @@ if 'SUMO_HOME' in os.environ:
 else:   
     sys.exit("please declare environment variable 'SUMO_HOME'")
 
-import traci
+from src.simulations.backend import traci
 
 class ThetaSim(Simulation):
 
     def __init__(self,network,taskparams):
         super().__init__(network = network,taskparams=taskparams)
+        self.theta = None
     
     def run(self):
 
         step = self.begin
+        self.theta = OnlineTheta(self.network)   # Theta is estimated from the live vehicles, no routes.xml needed
         
         while step < self.begin+ self.T:    
             traci.simulationStep(step) 
+            self.theta.update()
             step += 1
 
         return None
     
     def create_theta(self):
 
-        xmlpath = self.output_path + 'routes.xml'
-        self.theta = Theta(xmlpath,self.network)
         return Data(data = self.theta.get_theta())
         
\ No newline at end of file
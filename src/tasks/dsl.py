@@ -11,7 +11,7 @@ class DSL(Task):
 
     def __init__(self, taskparams, StudentControlSim):
         super().__init__(taskparams=taskparams)
-        self.actuators = ActuatorGroup(network=self.network,jsonfile=taskparams['files']['actuators'],actuator_type='edge')
+        self.actuators = ActuatorGroup(network=self.network,jsonfile=taskparams['files']['actuators'],actuator_type='edge',threshold=taskparams.get('actuation_threshold',0))
         self.simulation = StudentControlSim(network=self.network,taskparams=self.taskparams, actuators=self.actuators)
     
     def runtask(self, init_from_notebook= False, controller_class = None, controller_json = None):
@@ -40,6 +40,7 @@ class DSL(Task):
             'output_path': self.simulation.output_path,
             'taskparams': self.taskparams,
             'results': data,
+            'failed': self.simulation.failed,
         }
         self.experiment = Experiment(info=info,description='testing experiment')
         self.experiment.save()
@@ -7,7 +7,7 @@ from tools.utils import Parser
 from numpy import save, concat
 from pandas import DataFrame
 
-import shutil
+import os,shutil
 
 class Estimate(Task):
     """Estimate the parameters of a model from data."""
@@ -64,6 +64,25 @@ class Estimate(Task):
       
         
 
+        if self.parameter == 'mesocalibration':
+            data = {}
+            for mode in ['micro','meso']:
+                print(f'Running {mode} MFD simulation...')
+                self.simulation = MFDSim(self.network,dict(self.taskparams,mesosim = mode == 'meso'))
+                self.simulation.start_traci()
+                data[mode] = self.simulation.run()
+                self.simulation.close_traci()
+                shutil.rmtree(self.simulation.output_path)
+
+            print('Comparing the MFDs...')
+            self.calibration = self.network.regions.compare_MFD(data['micro'],data['meso'],degree = self.taskparams['degree'],n_PWA = self.taskparams['n_PWA'])
+            self.mfd_data = data
+            os.makedirs(f'./out/{self.networkname}/',exist_ok=True)
+            self.calibration.to_csv(f'./out/{self.networkname}/meso_calibration_{self.id}.csv')
+            print(self.calibration)
+            if not self.calibration['trusted'].all():
+                print('The mesoscopic MFDs deviate from the microscopic ones, use mesosim for screening only with care')
+
     def init_actuators(self):
         actuators = []
         return actuators
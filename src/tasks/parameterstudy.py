@@ -1,22 +1,29 @@
 from src.tasks.task import Task
 from actuators.actuatorgroup import ActuatorGroup
-from simulations.controlsim import ControlSim
+from simulations.pool import SumoPool
 from data.experiment import Experiment
 from pandas import DataFrame
 from numpy import linspace
 
 class ParameterStudy(Task):
 
-    def __init__(self,taskparams):
+    def __init__(self,taskparams,StudentControlSim,pooled = True):
         super().__init__(taskparams=taskparams)
-        self.actuators = ActuatorGroup(network=self.network,jsonfile=taskparams['files']['actuators'],cycle=taskparams['files']['control_cycle'],actuator_type=self.taskparams['actuators'])
+        self.actuators = ActuatorGroup(network=self.network,jsonfile=taskparams['files']['actuators'],cycle=taskparams['files']['control_cycle'],actuator_type=self.taskparams['actuators'],threshold=taskparams.get('actuation_threshold',0))
+        self.StudentControlSim = StudentControlSim
         self.parameters = self.taskparams['parameters']
         self.paramrange = linspace(*self.taskparams['paramrange'])
         self.nparams = self.taskparams['paramrange'][2]
+        self.pool = SumoPool() if pooled else None
 
     def runtask(self):
-        '''Runs the task.'''
+        '''Runs the task.
+
+            With the pool, SUMO is reloaded for each grid point instead of restarted. The outputs
+            of a run are flushed when the next one is loaded, so its metrics are saved one run late.
+        '''
         counter = 0
+        pending = None
         params = {
                 "lambda_g" : 1,
                 "lambda_1" : 1,
@@ -35,25 +42,48 @@ class ParameterStudy(Task):
             for j in range(self.nparams):
                 params[self.parameters[1]] = self.paramrange[j]
                 try:
-                    self.simulation = ControlSim(network=self.network,
-                                                 taskparams=self.taskparams, 
-                                                 actuators=self.actuators,
-                                                 controlparams=params)
-                    self.simulation.start_traci()
+                    self.simulation = self.StudentControlSim(network=self.network,
+                                                             taskparams=self.taskparams, 
+                                                             actuators=self.actuators,
+                                                             controlparams=dict(params))
+                    self.simulation.output_path = f'./out/{self.network.name}/{self.id}/simulation {counter}/'
+                    self.simulation.start_traci(pool=self.pool)
+                    if pending is not None:
+                        finished,pending = pending,None   # not saved twice if saving it fails
+                        self.save_experiment(finished)
                     self.actuators.init_params()
                     self.simulation.run()
                     self.simulation.close_traci()
-                    data = self.simulation.comupute_metrics()
-                    
-                    info = {
-                        'output_path': self.simulation.output_path,
-                        'taskparams': self.taskparams,
-                        'results': data,
-                    }
-                    self.experiment = Experiment(info=info,description='testing experiment')
-                    self.experiment.save()
+                    if self.pool is None:
+                        self.save_experiment(self.simulation)
+                    else:
+                        pending = self.simulation
                 except:
                     print(f'Error in simulation {counter} with parameters   {self.parameters[0]} = {self.paramrange[i]} and {self.parameters[1]} = {self.paramrange[j]}')
+                    self.network.close_collector()   # close_traci was skipped, its worker threads would pile up over the study
+                    if self.pool is not None:
+                        self.pool.close()   # flushes the outputs of the last finished run
+                        if pending is not None:
+                            self.save_experiment(pending)
+                            pending = None
+                counter += 1
+
+        if self.pool is not None:
+            self.pool.close()
+            if pending is not None:
+                self.save_experiment(pending)
+            self.pool.summary()
         
         print('Study Parameter Study Successful')
-    
\ No newline at end of file
+
+    def save_experiment(self,simulation):
+        '''Computes the metrics of a finished simulation and saves them as an Experiment'''
+        data = simulation.compute_metrics()
+        info = {
+            'output_path': simulation.output_path,
+            'taskparams': self.taskparams,
+            'results': data,
+            'failed': simulation.failed,
+        }
+        self.experiment = Experiment(info=info,description='testing experiment')
+        self.experiment.save()
@@ -8,7 +8,7 @@ class TLS(Task):
     
     def __init__(self, taskparams):
         super().__init__(taskparams)
-        self.actuators = ActuatorGroup(network=self.network,jsonfile=taskparams['files']['actuators'],cycle=taskparams['files']['control_cycle'],actuator_type='tls')
+        self.actuators = ActuatorGroup(network=self.network,jsonfile=taskparams['files']['actuators'],cycle=taskparams['files']['control_cycle'],actuator_type='tls',threshold=taskparams.get('actuation_threshold',0))
         self.simulation = ControlSim(network=self.network,taskparams=self.taskparams, actuators=self.actuators)
         
     def runtask(self):
@@ -24,6 +24,7 @@ class TLS(Task):
             'output_path': self.simulation.output_path,
             'taskparams': self.taskparams,
             'results': data,
+            'failed': self.simulation.failed,
         }
         self.experiment = Experiment(info=info,description='testing experiment')
         self.experiment.save()
@@ -7,7 +7,7 @@ import matplotlib.cm as cm
 import matplotlib.colors as mcolors
 import pandas as pd
 import SumoNetVis
-import imageio, os
+import imageio, os, gzip
 from IPython.display import display, Image
 
 
@@ -22,22 +22,24 @@ def read_density_file_and_gen_colormap(density_file):
     
 def read_lanewise_density_file_and_gen_colormap(lane_density_file):
     """Reads a lane-wise density file and generates a consistent colormap across all time frames."""
-    tree = ET.parse(lane_density_file)
-    root = tree.getroot()
-
-    # Extract lane density values over time
+    # Extract lane density values over time, one interval at a time
     time_series_density = []
     all_lanes = set()
     
-    for interval in root.findall("interval"):
-        time_step = {}
-        for edge in interval.findall("edge"):
-            edge_id = edge.get("id")
-            density = float(edge.get("laneDensity", 0))
-            time_step[edge_id] = density
-            all_lanes.add(edge_id)
-        
-        time_series_density.append(time_step)
+    opener = gzip.open if lane_density_file.endswith(".gz") else open
+    with opener(lane_density_file, "rb") as f:
+        for _, interval in ET.iterparse(f):
+            if interval.tag != "interval":
+                continue
+            time_step = {}
+            for edge in interval.findall("edge"):
+                edge_id = edge.get("id")
+                density = float(edge.get("laneDensity", 0))
+                time_step[edge_id] = density
+                all_lanes.add(edge_id)
+            
+            time_series_density.append(time_step)
+            interval.clear()  # free the edges of the interval
     
     # Convert to DataFrame for easier processing
     df = pd.DataFrame(time_series_density)
@@ -236,6 +238,8 @@ def cocoCity_plot_generate_density_gif(output_dir, output_gif_path):
 
     region_density_file = ""
     lane_density_file = output_dir+"/edge_data_new.xml"
+    if not os.path.exists(lane_density_file):
+        lane_density_file += ".gz"  # written with compress_outputs
     output_image_dir = output_dir+"/img"
     
     
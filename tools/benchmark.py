@@ -0,0 +1,47 @@
+import time
+from copy import deepcopy
+
+import numpy as np
+from pandas import DataFrame
+
+def compare_backends(taskparams, StudentControlSim, controller_class, controller_json, backends = ['traci','libsumo'], repeats = 1):
+    '''Runs the same DSL task against each SUMO backend and compares wall-clock time and results.
+
+    Args:
+        taskparams: the task parameters (dict) shared by all the runs
+        StudentControlSim: the ControlSim subclass used by the DSL task
+        controller_class: the controller class, passed to DSL.runtask
+        controller_json: the controller parameters, passed to DSL.runtask
+        backends: the backends to compare, the first one is the reference
+        repeats: number of runs per backend, the fastest one is reported
+
+    Returns:
+        A DataFrame with one row per backend: best wall time [s], simulated seconds per wall
+        second, speedup with respect to the reference and max abs deviation of the regional densities.
+    '''
+    from src.tasks.dsl import DSL
+
+    rows = []
+    reference = None
+    for backend in backends:
+        params = deepcopy(taskparams)
+        params['backend'] = backend
+        params['id'] = f"{taskparams['id']}_{backend}"
+        times = []
+        for _ in range(repeats):
+            task = DSL(params, StudentControlSim)
+            start = time.perf_counter()
+            experiment = task.runtask(init_from_notebook=True, controller_class=controller_class, controller_json=deepcopy(controller_json))
+            times.append(time.perf_counter() - start)
+
+        density = experiment.results['density_results'].values
+        if reference is None:
+            reference = (min(times), density)
+        rows.append({'backend': backend,
+                     'wall_time': round(min(times),2),
+                     'sim_speed': round((params['end']-params['begin'])/min(times),1),
+                     'speedup': round(reference[0]/min(times),2),
+                     'max_density_deviation': float(np.abs(density-reference[1]).max()),
+                     })
+
+    return DataFrame(rows).set_index('backend')
@@ -1,5 +1,5 @@
 from itertools import groupby
-import sys,os,ast,pickle,importlib,re,json
+import sys,os,ast,pickle,importlib,re,json,gzip
 
 import matplotlib.pyplot  as plt
 import numpy as np
@@ -128,11 +128,26 @@ def write_taz(objects,path,byregion = False):
         print('Writing TAZ : Success')
 
 
+def iter_xml(xmlfile,tag):
+    '''Yields the elements with the given tag of a SUMO output one at a time.
+
+    The file is parsed incrementally and every element is freed once consumed, so the memory
+    stays bounded for outputs of any size. Files ending in .gz are decompressed on the fly.
+
+    Args:
+        xmlfile: path of the .xml or .xml.gz file
+        tag: the tag of the elements to yield (e.g. 'tripinfo', 'vehicle', 'interval')
+    '''
+    opener = gzip.open if xmlfile.endswith('.gz') else open
+    with opener(xmlfile,'rb') as f:
+        for _,element in etree.iterparse(f,events=('end',),tag=tag,recover=True):
+            yield element
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
 def compute_demand(xmlfile,duration,byregion = False,regions = '',grid = False, window = 60):
     ''' Computes the demand from a given xml file'''
-    parser = etree.XMLParser(recover=True)
-    tree = etree.parse(xmlfile,parser= parser)
-    root = tree.getroot() 
 
     if byregion:
         with open(regions,'r') as f:
@@ -144,9 +159,9 @@ def compute_demand(xmlfile,duration,byregion = False,regions = '',grid = False,
         cols = [f'from {i} to {j}' for i in regions.keys() for j in regions.keys()]
 
 
-        for veh in root:
-            t = int(float(veh.values()[1]))     
-            route = veh.getchildren()[0].values()[0].split(' ')
+        for veh in iter_xml(xmlfile,'vehicle'):
+            t = int(float(veh.get('depart')))     
+            route = veh[0].get('edges').split(' ')
             dep_edge = route[0]
             arr_edge = route[-1]
             # dep_edge = veh.values()[2]
@@ -162,8 +177,8 @@ def compute_demand(xmlfile,duration,byregion = False,regions = '',grid = False,
     else:  
         cols = ['total demand']      
         total = np.zeros(duration)
-        for veh in root:
-            t = int(float(veh.values()[1]))    
+        for veh in iter_xml(xmlfile,'vehicle'):
+            t = int(float(veh.get('depart')))    
             total[t-54000]+=1
             
         demand = DataFrame(total,columns = cols)
@@ -176,20 +191,14 @@ def compute_demand(xmlfile,duration,byregion = False,regions = '',grid = False,
 
 def depart_arrival(xmlfile,):
     
-    parser = etree.XMLParser(recover=True)
-    tree = etree.parse(xmlfile,parser= parser)
-    root = tree.getroot()
-    n_veh = len(root)
-    depart = np.zeros(n_veh)
-    arrival = np.zeros(n_veh)
-    i = 0
-
-    for veh in root:    
-        depart[i] = veh.values()[2]
-        arrival[i] = veh.values()[8]
-        i+=1
+    depart = []
+    arrival = []
+
+    for veh in iter_xml(xmlfile,'tripinfo'):    
+        depart.append(veh.get('depart'))
+        arrival.append(veh.get('arrival'))
     
-    return depart,arrival
+    return np.array(depart,dtype=float),np.array(arrival,dtype=float)
 
 
 def plot_single(array,ylabel, region):